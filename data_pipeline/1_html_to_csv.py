@@ -1,8 +1,12 @@
 import pandas as pd
-from bs4 import BeautifulSoup
+import pyarrow as pa
+from lxml import etree
 import re
 import os
+from concurrent.futures import ProcessPoolExecutor
 from boxsdk import Client, OAuth2
+from box_sync import sync_folder
+from storage import TABLE_FORMAT, TableWriter, with_format
 
 # ---- BOX CONFIG ----
 # Replace with your Box developer token
@@ -12,10 +16,19 @@ LOCAL_OUTPUT_DIR = '/scratch/cjpenni/departmental-honors/data_pipeline/html_to_c
 os.makedirs(LOCAL_OUTPUT_DIR, exist_ok=True)
 # ---------------------
 
+# ---- PARSER CONFIG ----
+PARSE_WORKERS = os.cpu_count() or 1  # html files parsed in parallel
+CHUNK_ROWS = 50_000  # rows buffered before they are appended to the csv
+CSV_COLUMNS = ['Search Site', 'Search Link', 'Search Title', 'Search Date', 'Search Time']
+PARQUET_SCHEMA = pa.schema([(col, pa.string()) for col in CSV_COLUMNS])  # used when TABLE_FORMAT is "parquet"
+# ---------------------
+
+# Date and time format used by Takeout, e.g. "Jan 5, 2024, 10:03:12 PM EST"
+DATETIME_PATTERN = re.compile(r"(?P<month>(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec))\s+(?P<day>\d{1,2}),\s+(?P<year>\d{4}),\s+(?P<hour>\d{1,2}):(?P<minute>\d{2}):(?P<second>\d{2})\s+(?P<meridian>[APap][Mm])\s+(?P<timezone>[A-Z]+)")
+LINK_PATTERN = re.compile(r'q=(https://[^\&]+)')
+
 def extract_and_remove_datetime(text):
-    # Define a regex pattern for the specified date and time format
-    datetime_pattern = r"(?P<month>(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec))\s+(?P<day>\d{1,2}),\s+(?P<year>\d{4}),\s+(?P<hour>\d{1,2}):(?P<minute>\d{2}):(?P<second>\d{2})\s+(?P<meridian>[APap][Mm])\s+(?P<timezone>[A-Z]+)"
-    match = re.search(datetime_pattern, text)
+    match = DATETIME_PATTERN.search(text)
     if match:
         date = match.group('month') + " " + match.group('day') + ", " + match.group('year')
         time = match.group('hour') + ":" + match.group('minute') + ":" + match.group('second') + " " + match.group('meridian') + " " + match.group('timezone')
@@ -23,48 +36,97 @@ def extract_and_remove_datetime(text):
     else:
         return None, None
 
-def read_html_file_fast(input_html):
-    """Efficiently reads an HTML file and returns a parsed BeautifulSoup object."""
-    with open(input_html, 'r', encoding='utf-8') as f:
-        return BeautifulSoup(f.read(), 'lxml')  # Use 'lxml' for speed
+def _has_class(element, class_name):
+    return class_name in (element.get('class') or '').split()
 
-def process_html_to_csv(input_html, output_csv):
-    soup = read_html_file_fast(input_html)
+def _find(element, tag, class_name=None):
+    """First descendant with the given tag (and class), like BeautifulSoup's find."""
+    for child in element.iter(tag):
+        if child is not element and (class_name is None or _has_class(child, class_name)):
+            return child
+    return None
 
-    # Extract all activity entries
-    entries = soup.find_all('div', class_='outer-cell')
+def _text(element):
+    """Same as BeautifulSoup's get_text(strip=True)."""
+    return ''.join(s.strip() for s in element.itertext())
 
-    data = []
-    for entry in entries:
-        # Extract source (Column 1)
-        source_tag = entry.find('p', class_='mdl-typography--title')
-        source = source_tag.get_text(strip=True) if source_tag else None
+def parse_entry(entry):
+    # Extract source (Column 1)
+    source_tag = _find(entry, 'p', 'mdl-typography--title')
+    source = _text(source_tag) if source_tag is not None else None
 
-        # Extract link (Column 2)
-        link_tag = entry.find('a')
-        link = None
-        if link_tag:
-            match = re.search(r'q=(https://[^\&]+)', link_tag['href'])
-            link = match.group(1) if match else link_tag['href']
+    # Extract link (Column 2)
+    link_tag = _find(entry, 'a')
+    link = None
+    if link_tag is not None:
+        href = link_tag.get('href')
+        match = LINK_PATTERN.search(href)
+        link = match.group(1) if match else href
 
-        # Extract title (Column 3)
-        title = None
-        if link_tag:
-            title = None if "https://" in link_tag.get_text(strip=True) else link_tag.get_text(strip=True)
+    # Extract title (Column 3)
+    title = None
+    if link_tag is not None:
+        link_text = _text(link_tag)
+        title = None if "https://" in link_text else link_text
 
-        # Extract date and time (Column 4 & 5)
-        text_content = entry.find('div', class_='content-cell').get_text(strip=True)
-        date, time = extract_and_remove_datetime(text_content)
+    # Extract date and time (Column 4 & 5)
+    text_content = _text(_find(entry, 'div', 'content-cell'))
+    date, time = extract_and_remove_datetime(text_content)
+
+    return [source, link, title, date, time]
+
+def iter_activity_rows(input_html):
+    """Stream rows out of a Takeout MyActivity file one `outer-cell` at a time."""
+    for _, element in etree.iterparse(input_html, events=('end',), tag='div', html=True, encoding='utf-8'):
+        if not _has_class(element, 'outer-cell'):
+            continue
+        yield parse_entry(element)
+        # Drop the parsed entry and everything before it so the tree never grows
+        element.clear()
+        parent = element.getparent()
+        while element.getprevious() is not None:
+            del parent[0]
+
+def process_html_to_csv(input_html, output_csv):
+    fmt = 'parquet' if output_csv.endswith('.parquet') else 'csv'
+    # Write to a temp file first so an interrupted run never leaves a table that looks finished
+    tmp_path = output_csv + '.part'
+    chunk = []
+    try:
+        with TableWriter(tmp_path, fmt=fmt, schema=PARQUET_SCHEMA) as writer:
+            for row in iter_activity_rows(input_html):
+                chunk.append(row)
+                if len(chunk) >= CHUNK_ROWS:
+                    writer.write(pd.DataFrame(chunk, columns=CSV_COLUMNS))
+                    chunk = []
+            if chunk or not writer.rows:
+                writer.write(pd.DataFrame(chunk, columns=CSV_COLUMNS))
+    except BaseException:
+        # Don't leave a partial table behind, the next run starts this file over
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-        # Append data to list
-        data.append([source, link, title, date, time])
+    os.replace(tmp_path, output_csv)
+    print(f"Saved {fmt} to {output_csv} ({writer.rows} rows)")
+    return output_csv
 
-    # Create DataFrame
-    df = pd.DataFrame(data, columns=['Search Site', 'Search Link', 'Search Title', 'Search Date', 'Search Time'])
+def is_up_to_date(input_html, output_csv):
+    return os.path.exists(output_csv) and os.path.getmtime(output_csv) >= os.path.getmtime(input_html)
 
-    # Save to CSV
-    df.to_csv(output_csv, index=False)
-    print(f"Saved CSV to {output_csv}")
+def process_all_html(html_paths, workers=PARSE_WORKERS):
+    """Convert every html file to a table next to it, in parallel, skipping ones already converted."""
+    jobs = []
+    for html_path in html_paths:
+        output_csv = with_format(html_path, TABLE_FORMAT)
+        if is_up_to_date(html_path, output_csv):
+            print(f"Skipping {html_path}, {output_csv} is up to date")
+            continue
+        jobs.append((html_path, output_csv))
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        return list(executor.map(process_html_to_csv, *zip(*jobs)))
 
 def main():
     oauth2 = OAuth2(
@@ -73,18 +135,9 @@ def main():
         access_token=BOX_DEVELOPER_TOKEN
     )
     client = Client(oauth2)
-    folder = client.folder(folder_id=BOX_FOLDER_ID).get()
-    items = folder.get_items()
-    for item in items:
-        if item.type == 'file' and item.name.lower().endswith('.html'):
-            local_html_path = os.path.join(LOCAL_OUTPUT_DIR, item.name)
-            with open(local_html_path, 'wb') as f:
-                client.file(item.id).download_to(f)
-            output_csv = os.path.join(
-                LOCAL_OUTPUT_DIR,
-                os.path.splitext(item.name)[0] + '.csv'
-            )
-            process_html_to_csv(local_html_path, output_csv)
+    # Only new or changed files are downloaded, and only those get reparsed
+    html_paths, _ = sync_folder(client, BOX_FOLDER_ID, LOCAL_OUTPUT_DIR)
+    process_all_html(html_paths)
 
 if __name__ == "__main__":
     main()
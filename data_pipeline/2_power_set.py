@@ -1,96 +1,222 @@
+import argparse
+import hashlib
+import json
 import pandas as pd
 import os
-from glob import glob
+from storage import TABLE_FORMAT, list_tables, read_table, with_format, write_table
 
 # ========== CONFIGURATION ==========
 CSV_FOLDER = '/scratch/cjpenni/departmental-honors/data_pipeline/html_to_csv_output'
 POWERSET_OUTPUT = '/scratch/cjpenni/departmental-honors/data_pipeline/powerset_all_year_col.csv'
 POWERSET_200_OUTPUT = '/scratch/cjpenni/departmental-honors/data_pipeline/powerset_col200++.csv'
-FILTERED_BY_YEAR_FOLDER = '/scratch/cjpenni/departmental-honors/data_pipeline/filtered_by_year'
-POWERSET_BY_YEAR_OUTPUT = '/scratch/cjpenni/departmental-honors/data_pipeline/powerset_by_year/allActivity_2024.csv'
-
-os.makedirs(FILTERED_BY_YEAR_FOLDER, exist_ok=True)
-os.makedirs(os.path.dirname(POWERSET_BY_YEAR_OUTPUT), exist_ok=True)
-
-# ========== READ ALL FILES ==========
-csv_files = glob(os.path.join(CSV_FOLDER, "*.csv"))
-df_names = []
-search_title_dfs = []
-
-for file in csv_files:
-    output_filename = os.path.splitext(os.path.basename(file))[0]
-    df = pd.read_csv(file)
-    search_title_cols = [col for col in df.columns if "Search Title" in col]
-    search_date_cols = [col for col in df.columns if "Search Date" in col]
-    if search_title_cols and search_date_cols:
-        search_title_df = df[search_title_cols + search_date_cols].copy()
-        for date_col in search_date_cols:
-            search_title_df[date_col] = pd.to_datetime(search_title_df[date_col], errors='coerce').dt.year
-        for col in search_title_cols:
-            search_title_df[col] = search_title_df[col].str.lower().str.replace(r'\s+', ' ', regex=True).str.strip()
-        search_title_df.dropna(subset=search_title_cols, inplace=True)
-        search_title_df.drop_duplicates(inplace=True)
-        search_title_df.columns = [f"{output_filename}_{col}" for col in search_title_df.columns]
-        search_title_dfs.append(search_title_df)
-    df_names.append(output_filename)
-
-if search_title_dfs:
-    combined_search_titles_df = pd.concat(search_title_dfs, axis=1)
-    combined_search_titles_df.to_csv(POWERSET_OUTPUT, index=False, encoding='utf-8')
-    print(f"Data saved to {POWERSET_OUTPUT}")
-
-# ========== DROPPING COLUMNS THAT HAS LESS THAN 200 DATA POINTS ==========
-if search_title_dfs:
-    column_lengths = combined_search_titles_df.count()
-    columns_to_keep = column_lengths[column_lengths >= 200].index
-    combined_search_titles_df = combined_search_titles_df[columns_to_keep]
-    print(combined_search_titles_df.head())
-    combined_search_titles_df.to_csv(POWERSET_200_OUTPUT, index=False, encoding='utf-8')
-    print(f"Data saved to {POWERSET_200_OUTPUT}")
-
-# ========== FILTERING SEARCH TITLES FOR GIVEN ACTIVITY BY YEAR ==========
-def process_dataframe(df, df_name):
-    search_title_cols = [col for col in df.columns if "Search Title" in col]
-    search_date_cols = [col for col in df.columns if "Search Date" in col or "Date" in col]
-    if not search_title_cols or not search_date_cols:
-        print(f"Skipping {df_name}: No valid 'Search Title' or 'Search Date' column found.")
+POWERSET_BY_YEAR_FOLDER = '/scratch/cjpenni/departmental-honors/data_pipeline/powerset_by_year'  # one allActivity_<year> table per year
+MIN_COLUMN_COUNT = 200  # columns with fewer non-empty rows are dropped from POWERSET_200_OUTPUT
+TITLE_COL = 'Search Title'
+DATE_COL = 'Search Date'
+DATE_FORMAT = '%b %d, %Y'  # Takeout dates look like "Jan 5, 2024"
+
+# Incremental builds: every source's normalized titles and per-year titles are cached here,
+# and the manifest records the mtime, size and sha1 each cache entry was built from.
+CACHE_FOLDER = '/scratch/cjpenni/departmental-honors/data_pipeline/powerset_cache'
+MANIFEST_NAME = 'powerset_manifest.json'
+CACHE_VERSION = 1  # bump when the per-source processing changes, forces a full rebuild
+
+os.makedirs(POWERSET_BY_YEAR_FOLDER, exist_ok=True)
+os.makedirs(CACHE_FOLDER, exist_ok=True)
+
+# ========== READ EACH SOURCE ONCE ==========
+def parse_years(dates):
+    """Year of every date as a nullable integer, parsing the Takeout format first."""
+    parsed = pd.to_datetime(dates, format=DATE_FORMAT, errors='coerce')
+    # Anything not in the Takeout format is parsed value by value ("mixed"), which also
+    # avoids pandas warning that it could not infer one format for the whole column
+    retry = parsed.isna() & dates.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(dates[retry], format='mixed', errors='coerce')
+    return parsed.dt.year.astype('Int64')
+
+def load_source(path):
+    """Read the title and date columns of one takeout table, or None if it has neither."""
+    try:
+        df = read_table(path, columns=[TITLE_COL, DATE_COL])
+    except (ValueError, KeyError):
+        print(f"Skipping {os.path.basename(path)}: No valid '{TITLE_COL}' or '{DATE_COL}' column found.")
+        return None
+    df[DATE_COL] = parse_years(df[DATE_COL])
+    return df
+
+def normalized_titles(df, name):
+    """Lowercased, whitespace-collapsed titles with their year, deduplicated."""
+    out = df.copy()
+    out[TITLE_COL] = out[TITLE_COL].str.lower().str.replace(r'\s+', ' ', regex=True).str.strip()
+    out = out.dropna(subset=[TITLE_COL]).drop_duplicates()
+    out.columns = [f"{name}_{col}" for col in out.columns]
+    return out
+
+def titles_by_year(df, name):
+    """{year: Series of the source's raw titles in that year}, first occurrence of each title only."""
+    raw = df.drop_duplicates(subset=[TITLE_COL]).dropna(subset=[TITLE_COL])
+    raw = raw.dropna(subset=[DATE_COL])
+    return {
+        int(year): group[TITLE_COL].reset_index(drop=True).rename(f"{name}_{TITLE_COL}")
+        for year, group in raw.groupby(DATE_COL, sort=True)
+    }
+
+# ========== COMBINE ==========
+def combine_all_years(normalized):
+    return pd.concat(normalized, axis=1)
+
+def drop_sparse_columns(combined, min_count=MIN_COLUMN_COUNT):
+    column_lengths = combined.count()
+    return combined[column_lengths[column_lengths >= min_count].index]
+
+def combine_year(per_source_years, year):
+    """Table with one left-packed title column per source that has data in `year`."""
+    return pd.concat([by_year[year] for by_year in per_source_years if year in by_year], axis=1)
+
+# ========== INCREMENTAL CACHE ==========
+def build_settings():
+    """Everything besides the source contents that the cached results depend on."""
+    return {'version': CACHE_VERSION, 'title_col': TITLE_COL, 'date_col': DATE_COL,
+            'date_format': DATE_FORMAT, 'table_format': TABLE_FORMAT}
+
+def file_sha1(path, block_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(path, manifest):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, path)
+
+def source_changed(path, entry):
+    """
+    Compare a source against its manifest entry. An unchanged mtime and size is
+    trusted; otherwise the file is hashed so a touched but identical file is not
+    reprocessed. Returns (changed, sha1 or None if not hashed).
+    """
+    if entry is None or not os.path.exists(entry['cache']):
+        return True, None
+    stat = os.stat(path)
+    if entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+        return False, None
+    sha1 = file_sha1(path)
+    return sha1 != entry['sha1'], sha1
+
+def process_source(path, name):
+    """(normalized titles, {year: titles}) of one source, or None if it has no usable columns."""
+    df = load_source(path)
+    if df is None:
+        return None
+    return normalized_titles(df, name), titles_by_year(df, name)
+
+def changed_years(old_result, new_result):
+    """Years whose titles differ between two process_source results of the same source."""
+    old_years = old_result[1] if old_result is not None else {}
+    new_years = new_result[1] if new_result is not None else {}
+    return {year for year in set(old_years) | set(new_years)
+            if year not in old_years or year not in new_years or not old_years[year].equals(new_years[year])}
+
+# ========== BUILD ==========
+def main():
+    parser = argparse.ArgumentParser(description="Combine the takeout tables into power set tables.")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignore the cache in CACHE_FOLDER and reprocess every source.")
+    args = parser.parse_args()
+
+    manifest_path = os.path.join(CACHE_FOLDER, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    settings = build_settings()
+    if args.full or manifest.get('settings') != settings:
+        manifest = {}
+    old_sources = manifest.get('sources', {})
+    sources = {}
+    results = {}
+    affected_years = set()
+
+    for file in list_tables(CSV_FOLDER):
+        name = os.path.splitext(os.path.basename(file))[0]
+        entry = old_sources.get(name)
+        if entry is not None and entry['path'] != file:
+            entry = None  # e.g. the source switched from csv to parquet
+        changed, sha1 = source_changed(file, entry)
+        stat = os.stat(file)
+        if not changed:
+            print(f"Unchanged, using cache: {os.path.basename(file)}")
+            result = pd.read_pickle(entry['cache']) if entry['usable'] else None
+            sources[name] = dict(entry, mtime=stat.st_mtime, size=stat.st_size)
+        else:
+            print(f"Processing {os.path.basename(file)}")
+            result = process_source(file, name)
+            old_result = pd.read_pickle(entry['cache']) if entry is not None and os.path.exists(entry['cache']) else None
+            cache_path = os.path.join(CACHE_FOLDER, f"{name}.pkl")
+            pd.to_pickle(result, cache_path)
+            sources[name] = {'path': file, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                             'sha1': sha1 or file_sha1(file), 'cache': cache_path,
+                             'usable': result is not None,
+                             'years': sorted(result[1]) if result is not None else []}
+            affected_years.update(changed_years(old_result, result))
+        if result is not None:
+            results[name] = result
+
+    for name, entry in old_sources.items():
+        if name not in sources:
+            print(f"Source removed: {name}")
+            affected_years.update(entry['years'])
+            if os.path.exists(entry['cache']):
+                os.remove(entry['cache'])
+
+    if not results:
+        print(f"No usable tables found in {CSV_FOLDER}")
         return
-    search_data = df[search_title_cols + search_date_cols].copy()
-    date_col = search_date_cols[0]
-    search_data[date_col] = pd.to_datetime(search_data[date_col], errors='coerce').dt.year
-    search_data.dropna(subset=search_title_cols, inplace=True)
-    search_data.drop_duplicates(inplace=True)
-    unique_years = search_data[date_col].dropna().unique()
-    for year in unique_years:
-        year_data = search_data[search_data[date_col] == year][search_title_cols]
-        output_filename = f"{df_name}_search_titles_{year}.csv"
-        output_path = os.path.join(FILTERED_BY_YEAR_FOLDER, output_filename)
-        year_data.to_csv(output_path, index=False)
-        print(f"Saved: {output_filename} ({len(year_data)} rows)")
-
-# Load and process each DataFrame
-for file in csv_files:
-    output_filename = os.path.splitext(os.path.basename(file))[0]
-    df = pd.read_csv(file)
-    if "Search Title" in df.columns:
-        df.drop_duplicates(subset=["Search Title"], inplace=True)
-        df.dropna(subset=["Search Title"], inplace=True)
-    df.columns = [f"{output_filename}_{col}" for col in df.columns]
-    globals()[output_filename] = df
-
-for df_name in df_names:
-    if df_name in globals():
-        process_dataframe(globals()[df_name], df_name)
+
+    years = sorted({year for _, by_year in results.values() for year in by_year})
+    outputs = [with_format(POWERSET_OUTPUT, TABLE_FORMAT), with_format(POWERSET_200_OUTPUT, TABLE_FORMAT)]
+    year_outputs = {year: os.path.join(POWERSET_BY_YEAR_FOLDER, f"allActivity_{year}.csv") for year in years}
+    affected_years.update(year for year, path in year_outputs.items()
+                          if not os.path.exists(with_format(path, TABLE_FORMAT)))
+    sources_changed = sources.keys() != old_sources.keys() or any(
+        sources[name]['sha1'] != old_sources[name]['sha1'] for name in sources)
+
+    # The combined tables are concatenations of every source, so any change rebuilds them
+    # from the cached per-source frames; only the reading and normalizing is skipped.
+    if sources_changed or not all(os.path.exists(path) for path in outputs):
+        combined_search_titles_df = combine_all_years([normalized for normalized, _ in results.values()])
+        print(f"Data saved to {write_table(combined_search_titles_df, POWERSET_OUTPUT)}")
+
+        # ========== DROPPING COLUMNS THAT HAS LESS THAN 200 DATA POINTS ==========
+        combined_200 = drop_sparse_columns(combined_search_titles_df)
+        print(combined_200.head())
+        print(f"Data saved to {write_table(combined_200, POWERSET_200_OUTPUT)}")
     else:
-        print(f"Skipping {df_name}: DataFrame not found in memory.")
-
-# ========== COMBINE ALL FILTERED CSVs FOR A YEAR ==========
-YEAR = "2024"
-year_folder = FILTERED_BY_YEAR_FOLDER  # All CSVs are in the same folder
-csv_files_year = [f for f in glob(os.path.join(year_folder, f"*_{YEAR}.csv"))]
-if csv_files_year:
-    df_combined = pd.concat((pd.read_csv(file) for file in csv_files_year), ignore_index=True)
-    df_sorted = df_combined.apply(lambda col: col.dropna().tolist() + [None] * col.isna().sum(), axis=0)
-    df_sorted.to_csv(POWERSET_BY_YEAR_OUTPUT, index=False)
-    print(f"Combined and saved all activity for {YEAR} to {POWERSET_BY_YEAR_OUTPUT}")
-    non_nan_counts = df_combined.count()
\ No newline at end of file
+        print("No source changed, power set tables are up to date")
+
+    # ========== ALL ACTIVITY PER YEAR ==========
+    # Only years in which a changed source gained, lost or reordered titles need rewriting
+    per_source_years = [by_year for _, by_year in results.values()]
+    for year in sorted(affected_years):
+        if year not in year_outputs:
+            stale_path = with_format(os.path.join(POWERSET_BY_YEAR_FOLDER, f"allActivity_{year}.csv"), TABLE_FORMAT)
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+                print(f"Removed {stale_path}, no source has activity in {year} anymore")
+            continue
+        year_df = combine_year(per_source_years, year)
+        output_path = write_table(year_df, year_outputs[year])
+        print(f"Combined and saved all activity for {year} to {output_path} ({len(year_df)} rows)")
+    print(f"{len(affected_years & set(years))} of {len(years)} year tables rebuilt")
+
+    save_manifest(manifest_path, {'settings': settings, 'sources': sources})
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,232 @@
 import pandas as pd
+import argparse
+import hashlib
 import re
 import json
 import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
-import requests
 import os
+import requests
+from ollama_client import OllamaClient, add_cache_args, cache_from_args, validate_json
+from storage import read_table, write_records
+from token_budget import HistoryDigest, count_tokens, pack_history
 
 # ========== CONFIGURATION ==========
 OLLAMA_URL = 'http://localhost:11434/api/generate'  # Use /api/generate for streaming
 OLLAMA_MODEL = 'gpt-oss:20b'  # Change to your preferred local model
+OLLAMA_NUM_PARALLEL = int(os.environ.get('OLLAMA_NUM_PARALLEL', 4))  # max in-flight requests, match the server setting
+OLLAMA_KEEP_ALIVE = '30m'  # keep the model loaded between the configurations of a batch run
 POWERSET_CSV = '/scratch/cjpenni/departmental-honors/data_pipeline/power_set/powerset_by_year/allActivity_2024.csv'
 OUTPUT_FOLDER = '/scratch/cjpenni/departmental-honors/data_pipeline/inference_data/06OCT2025'
+# Each prompt's history is packed to fit NUM_CTX minus the prompt template and OUTPUT_TOKEN_RESERVE,
+# so Ollama never has to truncate it. Token counts come from the local tokenizer, see token_budget.py.
+NUM_CTX = 16384  # context window requested from Ollama
+OUTPUT_TOKEN_RESERVE = 4096  # room left for the model's reasoning and JSON reply
+# With --summarize-columns every column's history is summarized by the model once, and
+# combinations of at least SUMMARY_MIN_COMBO_SIZE columns are prompted with the summaries instead.
+SUMMARY_MIN_COMBO_SIZE = 3
+SUMMARY_WORDS = 150
+# Every finished combination is appended to CHECKPOINT_FILE, so a crashed run can pick up with --resume
+CHECKPOINT_FILE = os.path.join(OUTPUT_FOLDER, 'inference_checkpoint.jsonl')
+MAX_ATTEMPTS = 3  # tries per combination when the reply is not valid JSON (request failures are retried by OllamaClient)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-def count_tokens(text):
-    return len(text.split())  # Fallback: rough estimate
-
-def truncate_list(data_list, max_tokens):
-    truncated_list = []
-    token_count = 0
-    for item in data_list:
-        item_tokens = count_tokens(str(item))
-        if token_count + item_tokens <= max_tokens:
-            truncated_list.append(item)
-            token_count += item_tokens
-        else:
-            break
-    return truncated_list
-
-def run_prompt(prompt):
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": True
-    }
-    response = requests.post(OLLAMA_URL, json=payload, stream=True)
-    full_response = ""
-    for line in response.iter_lines():
-        if line:
-            data = json.loads(line.decode("utf-8"))
-            if "response" in data:
-                full_response += data["response"]
-    return full_response.strip()
-
-def clean_json_string(json_string):
+def clean_json_string(json_string, quiet=False):
     cleaned = re.sub(r"```json|```", " ", json_string)
     cleaned = re.sub(r"[^\u0000-\uFFFF]", "", cleaned)
     try:
         return json.loads(cleaned)
     except json.JSONDecodeError:
-        print(f"Warning: Failed to parse JSON, returning original: {json_string[:50]}...")
+        if not quiet:
+            print(f"Warning: Failed to parse JSON, returning original: {json_string[:50]}...")
         return cleaned
 
+def combination_id(selected_cols, inference_no, final_rec_no, model=OLLAMA_MODEL):
+    """Stable id of one combination's request, the same on every run with the same settings."""
+    key = json.dumps({"columns": list(selected_cols), "inference_no": inference_no,
+                      "final_rec_no": final_rec_no, "model": model}, sort_keys=True)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def prompt_sha1(prompt):
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+def load_checkpoint(path):
+    """{combination id: record} from a checkpoint file, later records winning. A torn last line is ignored."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["combination_id"]] = record
+    return records
+
+def append_checkpoint(f, record):
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+def build_inference_schema(inference_no, final_rec_no):
+    """JSON schema of one combination's reply, sent as Ollama's `format` in structured mode."""
+    return {
+        "type": "object",
+        "properties": {
+            "columns": {"type": "string"},
+            "inferences": {
+                "type": "array",
+                "minItems": inference_no,
+                "maxItems": inference_no,
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "inference": {"type": "string"},
+                        "uncommonness": {"type": "integer", "minimum": 1, "maximum": 10},
+                        "sensitivity": {"type": "integer", "minimum": 1, "maximum": 10},
+                        "explanation": {"type": "string"},
+                    },
+                    "required": ["inference", "uncommonness", "sensitivity", "explanation"],
+                },
+            },
+            "final_product_recommendations": {
+                "type": "array",
+                "minItems": final_rec_no,
+                "maxItems": final_rec_no,
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "title": {"type": "string"},
+                        "description": {"type": "string"},
+                    },
+                    "required": ["title", "description"],
+                },
+            },
+        },
+        "required": ["columns", "inferences", "final_product_recommendations"],
+    }
+
+def run_combination(client, prompt, max_attempts=MAX_ATTEMPTS, schema=None):
+    """
+    Send one prompt, asking again when the reply is not valid JSON. Retries
+    bypass the prompt cache so a bad cached reply is not returned again. With a
+    `schema` the reply is generated in Ollama's structured mode and must also
+    validate against it. Failed requests are already retried with backoff by
+    the client, so a request that still fails ends the combination here.
+    Only replies that parse (and validate) are cached.
+    Returns (gpt_output, parsed ok).
+    """
+    def accept(reply):
+        parsed = clean_json_string(reply, quiet=True)
+        return not validate_json(parsed, schema) if schema is not None else isinstance(parsed, dict)
+
+    gpt_output = None
+    for attempt in range(max_attempts):
+        if attempt:
+            print(f"⚠️ Asking again (attempt {attempt + 1}/{max_attempts})...")
+        try:
+            reply = client.run_prompt(prompt, refresh=True if attempt else None, format=schema, accept=accept)
+        except requests.RequestException as e:
+            print(f"⚠️ Ollama request failed after {client.max_retries + 1} tries: {e}")
+            break
+        gpt_output = clean_json_string(reply)
+        if schema is not None:
+            errors = validate_json(gpt_output, schema)
+            if not errors:
+                return gpt_output, True
+            print(f"⚠️ Reply does not match the schema: {'; '.join(errors[:3])}")
+        elif isinstance(gpt_output, dict):
+            return gpt_output, True
+    return gpt_output, False
+
 def write_json(output_filename, inference_json):
     if not inference_json:
         print("⚠️ No data to write. JSON file not created.")
         return None
-    with open(output_filename, "w", encoding="utf-8") as f:
-        json.dump(inference_json, f, indent=4, ensure_ascii=False)
+    output_filename = write_records(inference_json, output_filename)
     print(f"✅ JSON saved successfully as {output_filename}")
     return output_filename
 
-def build_prompts_for_user_combinations(
-    powerSubset2023,
-    inference_no,
-    rows,
-    combo_sizes,
-    final_rec_no=3,
-    folder="outputs"
-):
-    if isinstance(combo_sizes, int):
-        combo_sizes = [combo_sizes]
-    col_names = list(powerSubset2023.columns)
-    inference_json_list = []
-    for combo_size in combo_sizes:
-        if combo_size < 1 or combo_size > len(col_names):
-            print(f"⚠️ Skipping invalid combination size: {combo_size}")
-            continue
-        all_combos = list(itertools.combinations(col_names, combo_size))
-        for selected_cols in all_combos:
-            columns_str = " AND ".join(selected_cols)
-            col_data_list = [powerSubset2023[:rows][col] for col in selected_cols]
-            col_data_str = " AND ".join(
-                f"{col_data.dropna().tolist()} in {col_name}"
-                for col_data, col_name in zip(col_data_list, selected_cols)
-            )
-            prompt = f"""
+def format_history(packed):
+    """Render {column: printed item list} the way the prompt lists them: "[...] in col AND [...] in col"."""
+    return " AND ".join(f"{items} in {col_name}" for col_name, items in packed.items())
+
+def format_summaries(summaries):
+    return " AND ".join(f"the summary {json.dumps(summary, ensure_ascii=False)} of {col_name}"
+                        for col_name, summary in summaries.items())
+
+def build_column_digests(powerSubset2023, rows, cache=None):
+    """
+    Clean, deduplicate and measure every column's history once for all combinations.
+    Pass the same `cache` dict to reuse digests across configurations of a batch run.
+    """
+    cache = {} if cache is None else cache
+    for col in powerSubset2023.columns:
+        if (col, rows) not in cache:
+            cache[(col, rows)] = HistoryDigest(powerSubset2023[:rows][col].dropna().tolist())
+    return {col: cache[(col, rows)] for col in powerSubset2023.columns}
+
+def build_summary_prompt(history_str, col_name):
+    return f"""
+            Summarize what the following {col_name} of one user says about their interests, habits and circumstances.
+            Use at most {SUMMARY_WORDS} words of plain text. Keep specific names, places and topics that stand out.
+
+            {history_str}
+            """
+
+def summary_key(model, prompt):
+    return prompt_sha1(json.dumps({"model": model, "prompt": prompt}))
+
+def load_summaries(path):
+    """{summary key: summary} saved by an earlier run, empty if there is none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_summaries(path, summaries):
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(summaries, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def summarize_columns(digests, client, store_path=None, resume=False):
+    """
+    Ask the model for one summary per column, each packed into the full history budget.
+    Summaries are saved to `store_path`, keyed by model and prompt, and reused with
+    `resume=True` so re-sampled summaries (e.g. with --no-cache) do not change the
+    combination prompts. Columns whose request fails get no summary.
+    """
+    prompts = {}
+    for col, digest in digests.items():
+        overhead = count_tokens(build_summary_prompt("[]", col))
+        history_str, _ = digest.pack(max(NUM_CTX - OUTPUT_TOKEN_RESERVE - overhead, 0))
+        prompts[col] = build_summary_prompt(history_str, col)
+    stored = load_summaries(store_path) if resume and store_path is not None else {}
+    keys = {col: summary_key(client.model, prompt) for col, prompt in prompts.items()}
+    missing = [col for col in prompts if keys[col] not in stored]
+    print(f"🔹 Summarizing {len(missing)} columns once for combinations of {SUMMARY_MIN_COMBO_SIZE}+ columns"
+          f" ({len(prompts) - len(missing)} reused)...")
+
+    def summarize(col):
+        try:
+            return client.run_prompt(prompts[col]).strip()
+        except requests.RequestException as e:
+            print(f"⚠️ No summary for {col}, its combinations use the packed history: {e}")
+            return ""
+
+    for col, summary in zip(missing, client.map(summarize, missing)):
+        if summary:
+            stored[keys[col]] = summary
+    if store_path is not None:
+        save_summaries(store_path, stored)
+    return {col: stored[keys[col]] for col in prompts if keys[col] in stored}
+
+def build_prompt(col_data_str, columns_str, inference_no, final_rec_no):
+    return f"""
             User wants to know what {col_data_str} tells about them.
 
             1. Generate {inference_no} inferences about the user based on their online behavior, in the form "interested in X".
@@ -118,23 +258,155 @@ def build_prompts_for_user_combinations(
             }}
             ```
             """
-            
-            print(f"🔹 Sending prompt to Ollama for columns: {columns_str}...")
-            assistant_reply = run_prompt(prompt)
-            inference_json_list.append({
+
+def build_prompts_for_user_combinations(
+    powerSubset2023,
+    inference_no,
+    rows,
+    combo_sizes,
+    final_rec_no=3,
+    folder="outputs",
+    client=None,
+    summarize=False,
+    checkpoint_path=None,
+    resume=False,
+    output_name=None,
+    digest_cache=None,
+    structured=False
+):
+    if isinstance(combo_sizes, int):
+        combo_sizes = [combo_sizes]
+    if client is None:
+        # Run with a client of our own, closed however the run ends
+        with OllamaClient(OLLAMA_URL, OLLAMA_MODEL, max_workers=OLLAMA_NUM_PARALLEL,
+                          options={"num_ctx": NUM_CTX}, keep_alive=OLLAMA_KEEP_ALIVE) as client:
+            return build_prompts_for_user_combinations(
+                powerSubset2023, inference_no, rows, combo_sizes, final_rec_no=final_rec_no, folder=folder,
+                client=client, summarize=summarize, checkpoint_path=checkpoint_path, resume=resume,
+                output_name=output_name, digest_cache=digest_cache, structured=structured)
+    col_names = list(powerSubset2023.columns)
+    digests = build_column_digests(powerSubset2023, rows, cache=digest_cache)
+    if checkpoint_path is None:
+        checkpoint_path = Path(folder) / "inference_checkpoint.jsonl"
+    summaries = None
+    if summarize:
+        summaries = summarize_columns(digests, client, store_path=Path(checkpoint_path).with_suffix(".summaries.json"),
+                                      resume=resume)
+    jobs = []
+    prompt_stats = []
+    for combo_size in combo_sizes:
+        if combo_size < 1 or combo_size > len(col_names):
+            print(f"⚠️ Skipping invalid combination size: {combo_size}")
+            continue
+        all_combos = list(itertools.combinations(col_names, combo_size))
+        for selected_cols in all_combos:
+            columns_str = " AND ".join(selected_cols)
+            if (summaries is not None and combo_size >= SUMMARY_MIN_COMBO_SIZE
+                    and all(col in summaries for col in selected_cols)):
+                prompt = build_prompt(format_summaries({col: summaries[col] for col in selected_cols}),
+                                      columns_str, inference_no, final_rec_no)
+                stats = {
+                    "combined_cols": selected_cols,
+                    "prompt_tokens": count_tokens(prompt),
+                    "summarized": True,
+                }
+                prompt_stats.append(stats)
+                print(f"🔹 {columns_str}: {stats['prompt_tokens']} prompt tokens from column summaries")
+                jobs.append((selected_cols, combo_size, prompt))
+                continue
+            # Measure the template with empty lists to see how much room is left for the history
+            empty_str = format_history({col: "[]" for col in selected_cols})
+            overhead = count_tokens(build_prompt(empty_str, columns_str, inference_no, final_rec_no))
+            budget = NUM_CTX - OUTPUT_TOKEN_RESERVE - overhead
+            packed, col_stats = pack_history({col: digests[col] for col in selected_cols}, budget)
+            prompt = build_prompt(format_history(packed), columns_str, inference_no, final_rec_no)
+            stats = {
                 "combined_cols": selected_cols,
-                "combo_size": combo_size,
-                "gpt_output": assistant_reply
-            })
+                "prompt_tokens": count_tokens(prompt),
+                "history_budget": budget,
+                "columns": col_stats,
+            }
+            prompt_stats.append(stats)
+            kept = sum(c["kept_items"] for c in col_stats.values())
+            unique = sum(c["unique_items"] for c in col_stats.values())
+            print(f"🔹 {columns_str}: {stats['prompt_tokens']} prompt tokens, "
+                  f"kept {kept}/{unique} unique items in a {budget} token history budget")
+            
+            jobs.append((selected_cols, combo_size, prompt))
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"new_inferences_{timestamp}.json"
+    filename = f"new_inferences_{output_name or timestamp}.json"
     filepath = Path(folder) / filename
     filepath.parent.mkdir(parents=True, exist_ok=True)
+    if prompt_stats:
+        total = sum(stats["prompt_tokens"] for stats in prompt_stats)
+        largest = max(stats["prompt_tokens"] for stats in prompt_stats)
+        print(f"🔹 {total} prompt tokens over {len(prompt_stats)} prompts, largest {largest} (NUM_CTX {NUM_CTX})")
+        stats_file = write_records(prompt_stats, Path(folder) / f"prompt_stats_{output_name or timestamp}.json")
+        print(f"Per-prompt token stats saved to {stats_file}")
+
+    # Combinations already in the checkpoint with the same prompt and a valid reply are skipped on --resume
+    done = load_checkpoint(checkpoint_path) if resume else {}
+    job_ids = [combination_id(selected_cols, inference_no, final_rec_no, client.model)
+               for selected_cols, _, _ in jobs]
+    schema = build_inference_schema(inference_no, final_rec_no) if structured else None
+
+    def is_done(job_id, prompt):
+        record = done.get(job_id)
+        if record is None or not record["ok"] or record["prompt_sha1"] != prompt_sha1(prompt):
+            return False
+        # A reply from a free-form run only counts in structured mode if it matches the schema
+        return schema is None or not validate_json(record["gpt_output"], schema)
+
+    pending = [(job_id, job) for job_id, job in zip(job_ids, jobs) if not is_done(job_id, job[2])]
+    if resume:
+        print(f"🔹 Resuming from {checkpoint_path}: {len(jobs) - len(pending)} of {len(jobs)} combinations already done")
+
+    print(f"🔹 Sending {len(pending)} prompts to Ollama ({client.max_workers} in flight)...")
+    failed = 0
+    with open(checkpoint_path, 'a' if resume else 'w', encoding='utf-8') as checkpoint, \
+            ThreadPoolExecutor(max_workers=client.max_workers) as executor:
+        futures = {executor.submit(run_combination, client, job[2], schema=schema): (job_id, job)
+                   for job_id, job in pending}
+        for future in as_completed(futures):
+            job_id, (selected_cols, combo_size, prompt) = futures[future]
+            gpt_output, ok = future.result()
+            failed += not ok
+            record = {
+                "combination_id": job_id,
+                "combined_cols": list(selected_cols),
+                "combo_size": combo_size,
+                "prompt_sha1": prompt_sha1(prompt),
+                "ok": ok,
+                "gpt_output": gpt_output,
+            }
+            append_checkpoint(checkpoint, record)
+            done[job_id] = record
+    if failed:
+        print(f"⚠️ {failed} combinations failed or never returned valid JSON, rerun with --resume to retry them")
+
+    # Assemble the output from the checkpoint, in combination order
+    done = load_checkpoint(checkpoint_path)
+    inference_json_list = []
+    for job_id, (selected_cols, combo_size, prompt) in zip(job_ids, jobs):
+        if job_id not in done:
+            print(f"⚠️ No result for {' AND '.join(selected_cols)}")
+            continue
+        if not is_done(job_id, prompt):
+            # Keep failed or unusable replies out of the output so 3.1/3.2/4.0 only see valid entries
+            print(f"⚠️ Leaving out {' AND '.join(selected_cols)}, it failed or its reply was never valid "
+                  f"{'for the schema' if schema is not None else 'JSON'} (rerun with --resume to retry it)")
+            continue
+        inference_json_list.append({
+            "combined_cols": selected_cols,
+            "combo_size": combo_size,
+            "gpt_output": done[job_id]["gpt_output"]
+        })
     return inference_json_list, filepath
 
-def main():
-    # Load powerset data
-    powerset2024 = pd.read_csv(POWERSET_CSV)
+def load_powerset(path=POWERSET_CSV):
+    """Load the powerset table, fold the sparse columns into Misc and give the columns readable names."""
+    powerset2024 = read_table(path)
 
     # Select columns with less than 600 non-NaN rows
     misc_columns = powerset2024.columns[powerset2024.notna().sum() < 600]
@@ -156,6 +428,10 @@ def main():
         "YouTube_Search Title": "YT_search_history",
     })
 
+    return powerset2024
+
+def select_interactively(powerset2024):
+    """Ask for four columns and the inference and recommendation counts, or None on an invalid answer."""
     # Ask user to select four columns
     print("\nPlease select four datasets from the options (datasets should not be the same):")
     for i, col in enumerate(powerset2024.columns, 1):
@@ -200,7 +476,7 @@ def main():
         print(f"\nYou selected: {inference_no} inferences.")
     else:
         print("\nInvalid selection. Please enter a letter between a and d.")
-        return
+        return None
     
     # Ask user for number of final product recommendations
     rec_options = {'a': 1, 'b': 2, 'c': 3, 'd': 5}
@@ -216,24 +492,145 @@ def main():
         print(f"\nYou selected: {final_rec_no} final recommendation{'s' if final_rec_no != 1 else ''}.")
     else:
         print("\nInvalid selection for recommendations. Please enter a letter between a and d.")
-        return
-
-    # Build prompts and get GPT output
-    inference_json, output_file = build_prompts_for_user_combinations(
-        powerSubset2023,
-        inference_no=inference_no,
-        # Play with number of rows to see trade-off.
-        # use all rows, not just 200, for best results
-        rows=powerSubset2023.shape[0],
-        combo_sizes=[1, 2, 3, 4],
-        final_rec_no=final_rec_no,
-        folder=OUTPUT_FOLDER
-    )
-
-    # Clean GPT outputs
-    for entry in inference_json:
-        if isinstance(entry.get("gpt_output"), str):
-            entry["gpt_output"] = clean_json_string(entry["gpt_output"])
+        return None
+
+    return selected_columns, inference_no, final_rec_no
+
+def expand_sweep(spec):
+    """
+    Turn one sweep entry into configurations. Every field may be a single value
+    or a list, and all combinations of the listed values are run:
+    {"column_sets": [[...], ...], "inference_no": [3, 6], "final_rec_no": [3], "combo_sizes": [[1, 2, 3, 4]]}
+    """
+    def as_list(value, nested=False):
+        if nested:
+            return value if value and isinstance(value[0], list) else [value]
+        return value if isinstance(value, list) else [value]
+
+    column_sets = as_list(spec.get("column_sets", spec.get("columns")), nested=True)
+    return [
+        {
+            "columns": list(columns),
+            "inference_no": int(inference_no),
+            "final_rec_no": int(final_rec_no),
+            "combo_sizes": list(combo_sizes),
+            "rows": spec.get("rows"),
+            "summarize_columns": spec.get("summarize_columns", False),
+        }
+        for columns, inference_no, final_rec_no, combo_sizes in itertools.product(
+            column_sets,
+            as_list(spec["inference_no"]),
+            as_list(spec.get("final_rec_no", 3)),
+            as_list(spec.get("combo_sizes", [1, 2, 3, 4]), nested=True),
+        )
+    ]
+
+def load_sweep(path):
+    """Configurations from a JSON sweep file holding one sweep entry or a list of them."""
+    with open(path, 'r', encoding='utf-8') as f:
+        specs = json.load(f)
+    if isinstance(specs, dict):
+        specs = [specs]
+    return [config for spec in specs for config in expand_sweep(spec)]
+
+def config_key(config):
+    """
+    Key naming a configuration's output, checkpoint and stats files: a readable
+    part plus a short hash of every config field, so configurations that only
+    differ in e.g. rows or summarize_columns never share files.
+    """
+    cols = "+".join(re.sub(r"[^A-Za-z0-9]+", "-", col).strip("-") for col in config["columns"])
+    sizes = "".join(str(size) for size in config["combo_sizes"])
+    digest = hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    return f"{cols}_inf{config['inference_no']}_rec{config['final_rec_no']}_sizes{sizes}_{digest}"
+
+def run_batch(powerset2024, configs, client, resume=False, structured=False):
+    """Run every configuration on the same loaded table and client, each into its own keyed files."""
+    missing = sorted({col for config in configs for col in config["columns"]} - set(powerset2024.columns))
+    if missing:
+        raise ValueError(f"Unknown columns {missing}, available: {list(powerset2024.columns)}")
+    digest_cache = {}
+    for i, config in enumerate(configs, 1):
+        key = config_key(config)
+        print(f"\n========== Configuration {i}/{len(configs)}: {key} ==========")
+        powerSubset2023 = powerset2024[config["columns"]]
+        inference_json, output_file = build_prompts_for_user_combinations(
+            powerSubset2023,
+            inference_no=config["inference_no"],
+            rows=config["rows"] or powerSubset2023.shape[0],
+            combo_sizes=config["combo_sizes"],
+            final_rec_no=config["final_rec_no"],
+            folder=OUTPUT_FOLDER,
+            client=client,
+            summarize=config["summarize_columns"],
+            checkpoint_path=os.path.join(OUTPUT_FOLDER, f"inference_checkpoint_{key}.jsonl"),
+            resume=resume,
+            output_name=key,
+            digest_cache=digest_cache,
+            structured=structured
+        )
+        write_json(output_file, inference_json)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate inferences for every column combination with gpt-oss.")
+    parser.add_argument("--summarize-columns", action="store_true",
+                        help=f"Summarize each column once and prompt combinations of {SUMMARY_MIN_COMBO_SIZE}+ columns with the summaries.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip combinations already finished in the checkpoint file instead of starting over.")
+    parser.add_argument("--structured", action="store_true",
+                        help="Send the reply's JSON schema as Ollama's format and retry replies that do not validate.")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE,
+                        help=f"JSONL file every finished combination is appended to in interactive mode (default: {CHECKPOINT_FILE}).")
+    batch = parser.add_argument_group("batch mode", "Run without prompts, e.g. under sbatch. Use --config for a sweep, "
+                                                    "or --columns with --inference-no for a single configuration.")
+    batch.add_argument("--config", help="JSON sweep file, see expand_sweep for the format.")
+    batch.add_argument("--columns", nargs="+", help="Columns to combine, by their renamed names (e.g. Browser_history).")
+    batch.add_argument("--inference-no", type=int, help="Inferences per combination.")
+    batch.add_argument("--final-rec-no", type=int, default=3, help="Product recommendations per combination.")
+    batch.add_argument("--combo-sizes", type=int, nargs="+", default=[1, 2, 3, 4], help="Combination sizes to run.")
+    batch.add_argument("--rows", type=int, help="Only use the first ROWS rows of every column.")
+    add_cache_args(parser)
+    args = parser.parse_args()
+    if args.columns and args.inference_no is None:
+        parser.error("--columns needs --inference-no")
+
+    powerset2024 = load_powerset()
+    with OllamaClient(OLLAMA_URL, OLLAMA_MODEL, max_workers=OLLAMA_NUM_PARALLEL, options={"num_ctx": NUM_CTX},
+                      keep_alive=OLLAMA_KEEP_ALIVE, cache=cache_from_args(args), refresh=args.refresh) as client:
+
+        if args.config or args.columns:
+            if args.config:
+                configs = load_sweep(args.config)
+            else:
+                configs = expand_sweep({"columns": args.columns, "inference_no": args.inference_no,
+                                        "final_rec_no": args.final_rec_no, "combo_sizes": args.combo_sizes,
+                                        "rows": args.rows, "summarize_columns": args.summarize_columns})
+            print(f"🔹 Batch mode: {len(configs)} configurations")
+            run_batch(powerset2024, configs, client, resume=args.resume, structured=args.structured)
+            return
+
+        selection = select_interactively(powerset2024)
+        if selection is None:
+            return
+        selected_columns, inference_no, final_rec_no = selection
+        powerSubset2023 = powerset2024[selected_columns]
+
+        # Build prompts and get GPT output
+        inference_json, output_file = build_prompts_for_user_combinations(
+            powerSubset2023,
+            inference_no=inference_no,
+            # Play with number of rows to see trade-off.
+            # use all rows, not just 200, for best results
+            rows=powerSubset2023.shape[0],
+            combo_sizes=[1, 2, 3, 4],
+            final_rec_no=final_rec_no,
+            folder=OUTPUT_FOLDER,
+            client=client,
+            summarize=args.summarize_columns,
+            checkpoint_path=args.checkpoint,
+            resume=args.resume,
+            structured=args.structured
+        )
 
     # Write to JSON
     write_json(output_file, inference_json)
@@ -1,12 +1,14 @@
 import pandas as pd
 import numpy as np
+import argparse
 import re
 import json
 import itertools
 from pathlib import Path
 from datetime import datetime
-import requests
 import os
+from ollama_client import OllamaClient, add_cache_args, cache_from_args
+from storage import read_records, write_records
 
 # ========== CONFIGURATION ==========
 OLLAMA_URL = 'http://localhost:11434/api/generate'  # Use /api/generate for streaming
@@ -14,27 +16,29 @@ OLLAMA_MODEL = 'gpt-oss:20b'  # Change to your preferred local model
 FILE_PATH = '/scratch/cjpenni/departmental-honors/data_pipeline/inference_data/06OCT2025/new_inferences_rag.json'
 # OUTPUT_FOLDER = '/scratch/cjpenni/departmental-honors/data_pipeline/inference_data/06OCT2025'
 # os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-def run_prompt(prompt):
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": True
+BATCH_SIZE = 12  # inferences per categorization prompt, 0 sends one prompt per inference
+DETAIL_KEYS = ("category", "activity", "reason")
+# Structured mode (--structured) sends these schemas as Ollama's `format`
+DETAILS_SCHEMA = {
+    "type": "object",
+    "properties": {key: {"type": "string"} for key in DETAIL_KEYS},
+    "required": list(DETAIL_KEYS),
+}
+
+def build_batch_schema(n):
+    """Schema of a batched reply: exactly n detail objects, each carrying its list index."""
+    item = {
+        "type": "object",
+        "properties": {"index": {"type": "integer", "minimum": 0, "maximum": n - 1}, **DETAILS_SCHEMA["properties"]},
+        "required": ["index", *DETAIL_KEYS],
     }
-    response = requests.post(OLLAMA_URL, json=payload, stream=True)
-    full_response = ""
-    for line in response.iter_lines():
-        if line:
-            data = json.loads(line.decode("utf-8"))
-            if "response" in data:
-                full_response += data["response"]
-    return full_response.strip()
-
+    return {"type": "array", "items": item, "minItems": n, "maxItems": n}
 
-def extract_inference_details(inference_text):
+def extract_inference_details(inference_text, client, structured=False):
     """
     Use GPT to split an inference into category, activity, and reason.
     Falls back to default parsing if model output isn't valid JSON.
+    In structured mode the reply is constrained to DETAILS_SCHEMA and re-asked until it validates.
     """
 
     prompt = f"""
@@ -57,13 +61,16 @@ def extract_inference_details(inference_text):
     Return ONLY valid JSON.
     """
 
-    reply = run_prompt(prompt)  # Your existing GPT call
-    match = re.search(r"\{.*\}", reply, re.DOTALL)
-    if match:
-        try:
-            return json.loads(match.group(0))
-        except json.JSONDecodeError:
-            pass
+    if structured:
+        details, errors = client.run_structured(prompt, DETAILS_SCHEMA)
+        if not errors:
+            return {k: details[k] for k in DETAIL_KEYS}
+        print(f"⚠️ No valid details for {inference_text[:50]!r}: {'; '.join(errors[:3])}")
+    else:
+        # An unparseable reply stays out of the cache so the next run asks again
+        details = parse_details_reply(client.run_prompt(prompt, accept=lambda reply: parse_details_reply(reply) is not None))
+        if details is not None:
+            return details
 
     # Fallback default structure if parsing fails
     return {
@@ -72,7 +79,125 @@ def extract_inference_details(inference_text):
         "reason": inference_text
     }
 
-def add_inference_details(data):
+def build_batch_prompt(inference_texts):
+    """Build one prompt asking for category, activity, and reason of every inference."""
+    numbered = "\n".join(f"    {i}. {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(inference_texts))
+    return f"""
+    You are given a numbered list of inferences about a user's behavior or interests.
+    For EACH inference, extract a JSON object with the following keys:
+    - index: the number of the inference in the list
+    - category: a short theme (e.g., 'Health & Fitness', 'Travel', 'Cooking')
+    - activity: what the user is doing or interested in
+    - reason: the evidence or rationale given in the sentence
+
+    Example:
+    Input:
+    0. "The user is interested in health and fitness, as indicated by their search for exercises like 'leg raises' and 'calf raises', as well as their queries about tendonitis and Pilates."
+    Output: [
+      {{
+        "index": 0,
+        "category": "Health & Fitness",
+        "activity": "Exercise Routine like Pilates",
+        "reason": "User searched for exercises such as leg raises and calf raises, and looked up information on tendonitis and Pilates."
+      }}
+    ]
+
+    Now extract for these {len(inference_texts)} inferences:
+{numbered}
+    Return ONLY a valid JSON array with exactly {len(inference_texts)} objects, in the same order as the list.
+    """
+
+def parse_details_reply(reply):
+    """The details dict in a free-form reply, or None if there is none."""
+    match = re.search(r"\{.*\}", reply, re.DOTALL)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+
+def parse_batch_reply(reply, n):
+    """
+    Align a batched reply with its inputs by index.
+    Returns a list of length n holding a details dict, or None for every item
+    that is missing or malformed.
+    """
+    match = re.search(r"\[.*\]", reply, re.DOTALL)
+    if not match:
+        return [None] * n
+    try:
+        items = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return [None] * n
+    return align_batch_items(items, n)
+
+def align_batch_items(items, n):
+    """Place every well-formed item of a parsed batch reply at its index, None elsewhere."""
+    results = [None] * n
+    if not isinstance(items, list):
+        return results
+
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or not all(isinstance(item.get(k), str) for k in DETAIL_KEYS):
+            continue
+        idx = item.get("index", position)
+        if isinstance(idx, str) and idx.isdigit():
+            idx = int(idx)
+        if isinstance(idx, int) and 0 <= idx < n and results[idx] is None:
+            results[idx] = {k: item[k] for k in DETAIL_KEYS}
+    return results
+
+def normalize_inference(text):
+    """Key used to spot the same inference text across column combinations."""
+    return re.sub(r"\s+", " ", str(text)).strip().rstrip(".").lower()
+
+def categorize_inferences(inference_texts, client, batch_size=BATCH_SIZE, structured=False):
+    """
+    Return category, activity, and reason for every text, aligned with the input.
+    With batch_size > 0 the texts are sent in chunks of batch_size, and only
+    items that fail to parse are retried one at a time.
+    In structured mode batches are generated against build_batch_schema, and only
+    the items that do not validate are retried.
+    """
+    if batch_size < 1:
+        return client.map(lambda text: extract_inference_details(text, client, structured), inference_texts)
+
+    chunks = [inference_texts[start:start + batch_size] for start in range(0, len(inference_texts), batch_size)]
+    if structured:
+        # One try per batch: the valid items are kept and only the invalid ones are re-asked below
+        replies = client.map(
+            lambda chunk: client.run_structured(build_batch_prompt(chunk), build_batch_schema(len(chunk)), max_attempts=1),
+            chunks)
+        parsed = [align_batch_items(items, len(chunk)) for chunk, (items, _) in zip(chunks, replies)]
+    else:
+        # Only batches where every item parsed are cached, the others are asked again on the next run
+        replies = client.map(
+            lambda chunk: client.run_prompt(build_batch_prompt(chunk),
+                                            accept=lambda reply: None not in parse_batch_reply(reply, len(chunk))),
+            chunks)
+        parsed = [parse_batch_reply(reply, len(chunk)) for chunk, reply in zip(chunks, replies)]
+    results = [details for chunk_details in parsed for details in chunk_details]
+    # Items missing from their batch reply are re-asked one by one, but all in flight at once
+    missing = [i for i, details in enumerate(results) if details is None]
+    retried = client.map(lambda i: extract_inference_details(inference_texts[i], client, structured), missing)
+    for i, details in zip(missing, retried):
+        results[i] = details
+    fallbacks = len(missing)
+
+    if inference_texts:
+        print(f"Categorized {len(inference_texts)} inferences with {len(chunks) + fallbacks} prompts ({fallbacks} per-item fallbacks)")
+    return results
+
+def add_inference_details(data, client, batch_size=BATCH_SIZE, structured=False):
+    """
+    Add category, activity, and reason to every inference in place.
+    Identical inference texts are only sent to the model once and the result
+    is written back to every occurrence.
+    """
+    # Dedup index: normalized inference text -> every inference dict carrying it
+    occurrences = {}
+    total = 0
     for entry in data:
         gpt_output = entry.get("gpt_output", {})
 
@@ -85,31 +210,38 @@ def add_inference_details(data):
         inferences = gpt_output.get("inferences", [])
 
         for inf in inferences:
-            details = extract_inference_details(inf["inference"])
+            occurrences.setdefault(normalize_inference(inf["inference"]), []).append(inf)
+            total += 1
+
+    unique_texts = [infs[0]["inference"] for infs in occurrences.values()]
+    details_list = categorize_inferences(unique_texts, client, batch_size=batch_size, structured=structured)
+    for infs, details in zip(occurrences.values(), details_list):
+        for inf in infs:
             inf.update(details)
 
+    if total:
+        repeats = total - len(unique_texts)
+        print(f"Dedup: {len(unique_texts)} unique of {total} inferences, "
+              f"{repeats} reused ({repeats / total:.1%} hit rate)")
     return data
 
 
-with open(FILE_PATH, 'r') as f:
-    data = json.load(f)
-
-# --- Extract all inferences ---
-all_inferences = []
-for entry in data:
-    gpt_output = entry.get("gpt_output", {})
+def main():
+    parser = argparse.ArgumentParser(description="Add category/activity/reason to every inference with gpt-oss.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='Inferences per categorization prompt (0 = one prompt per inference).')
+    parser.add_argument('--structured', action='store_true',
+                        help="Constrain replies to a JSON schema with Ollama's format and retry only invalid ones.")
+    add_cache_args(parser)
+    args = parser.parse_args()
 
-    # Handle stringified JSON
-    if isinstance(gpt_output, str):
-        try:
-            gpt_output = json.loads(gpt_output)
-        except json.JSONDecodeError:
-            gpt_output = {}
+    data = read_records(FILE_PATH)
 
-    inferences = gpt_output.get("inferences", [])
+    with OllamaClient(OLLAMA_URL, OLLAMA_MODEL, cache=cache_from_args(args), refresh=args.refresh) as client:
+        updated_data = add_inference_details(data, client, batch_size=args.batch_size, structured=args.structured)
 
+    write_records(updated_data, "inferences_with_cat.json", indent=2)
 
-updated_data = add_inference_details(data)
 
-with open("inferences_with_cat.json", "w") as f:
-    json.dump(updated_data, f, indent=2)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
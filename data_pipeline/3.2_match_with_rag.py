@@ -1,39 +1,43 @@
 import json
-import pickle
+import os
+import sys
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import ast
 
+# vector_store.py lives in rag_pipeline/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag_pipeline"))
+from vector_store import VectorStore
+from retrieval import load_index, search
+from storage import read_records, write_records
+
 # Load your inference data
 json_path = '/scratch/cjpenni/departmental-honors/data_pipeline/inference_data/06OCT2025/new_inferences_20251113_093404.json'
 output_path = '/scratch/cjpenni/departmental-honors/data_pipeline/inference_data/06OCT2025/new_inferences_rag.json'
-with open(json_path, 'r') as f:
-    data = json.load(f)
+data = read_records(json_path)
 
-# Paths to your FAISS index and embeddings
-PKL_PATH = "/scratch/cjpenni/departmental-honors/rag_pipeline/product_embeddings.pkl"
+# Paths to your FAISS index and vector store
+STORE_DIR = "/scratch/cjpenni/departmental-honors/rag_pipeline/product_store"
 INDEX_PATH = "/scratch/cjpenni/departmental-honors/rag_pipeline/product_faiss_index.faiss"
-
-# Load model (must be the same as used for embeddings.pkl)
+INDEX_MMAP = True  # keep IVF inverted lists on disk instead of reading the whole index into RAM
+NPROBE = 32  # IVF indexes only, pick with evaluate_index.py
+EF_SEARCH = 64  # HNSW indexes only, pick with evaluate_index.py
+ENCODE_BATCH_SIZE = 256  # batch size for encoding recommendation texts
+# Opt-in: keep the model's recommendation when the best product match is below this cosine score.
+# Unset (the default) replaces every recommendation with its nearest product, as before.
+MIN_SIMILARITY = float(os.environ['PIPELINE_MIN_SIMILARITY']) if os.environ.get('PIPELINE_MIN_SIMILARITY') else None
+
+# Load model (must be the same as used to build the vector store)
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 model = SentenceTransformer(MODEL_NAME)
 
-# Load ids and embeddings metadata - read ALL batches
-all_meta = []
-with open(PKL_PATH, "rb") as f:
-    while True:
-        try:
-            meta, _ = pickle.load(f)   # your file format: (meta_list, embeddings) per pickle batch
-            all_meta.extend(meta)
-        except EOFError:
-            break
-
-ids = all_meta
-print(f"Loaded metadata for {len(ids)} items")
+# Open the vector store - metadata rows are only read for the ids FAISS returns
+store = VectorStore(STORE_DIR)
+print(f"Opened vector store with {len(store)} items")
 
 # Load FAISS index
-index = faiss.read_index(INDEX_PATH)
+index = load_index(INDEX_PATH, mmap=INDEX_MMAP, nprobe=NPROBE, ef_search=EF_SEARCH)
 print(f"Loaded FAISS index with {index.ntotal} vectors")
 
 def _flatten_description(desc):
@@ -45,28 +49,31 @@ def _flatten_description(desc):
         return " ".join(str(x) for x in desc if x)
     return str(desc)
 
+def _to_result(idx, score):
+    if idx < 0 or idx >= len(store):
+        # guard against invalid index
+        return {"meta": None, "score": float(score)}
+    meta = store.get_meta(int(idx))  # seeks to this row only
+    # extract fields if present (fall back to the whole meta if keys missing)
+    matched_title = meta.get("title") if isinstance(meta, dict) else meta
+    matched_description = _flatten_description(meta.get("description") if isinstance(meta, dict) else None)
+    return {
+        "meta": meta,
+        "matched_title": matched_title,
+        "matched_description": matched_description,
+        "score": float(score)
+    }
+
+def query_index_batch(texts, k=1):
+    """Encode all texts in one call, run one FAISS search, and return top k matches per text."""
+    if not texts:
+        return []
+    D, I = search(index, model, texts, k, batch_size=ENCODE_BATCH_SIZE)
+    return [[_to_result(idx, score) for idx, score in zip(row_I, row_D)] for row_I, row_D in zip(I, D)]
+
 def query_index(text, k=1):
-    """Query the FAISS index and return top k matches as metadata + distance."""
-    # ensure float32 numpy vector
-    query_vec = model.encode([text]).astype("float32")
-    D, I = index.search(query_vec, k)
-    results = []
-    for idx, dist in zip(I[0], D[0]):
-        if idx < 0 or idx >= len(ids):
-            # guard against invalid index
-            results.append({"meta": None, "distance": float(dist)})
-            continue
-        meta = ids[idx]  # metadata dict from your pickle
-        # extract fields if present (fall back to the whole meta if keys missing)
-        matched_title = meta.get("title") if isinstance(meta, dict) else meta
-        matched_description = _flatten_description(meta.get("description") if isinstance(meta, dict) else None)
-        results.append({
-            "meta": meta,
-            "matched_title": matched_title,
-            "matched_description": matched_description,
-            "distance": float(dist)
-        })
-    return results
+    """Query the FAISS index and return top k matches as metadata + cosine score."""
+    return query_index_batch([text], k)[0]
 
 def safe_load_json(possible_json):
     """Try to safely parse malformed JSON strings."""
@@ -84,7 +91,8 @@ def safe_load_json(possible_json):
             # Fallback: return empty dict so the loop continues
             return {}
 
-# Process each entry
+# Collect every recommendation up front so they can be matched in one batch
+pending_recs = []
 for entry in data:
     gpt_output = safe_load_json(entry.get("gpt_output", {}))
     final_recs = gpt_output.get("final_product_recommendations", [])
@@ -93,21 +101,32 @@ for entry in data:
         for rec in final_recs:
             title = rec.get("title", "")
             desc = rec.get("description", "")
-            combined_text = f"title: {title}; description: {desc}".strip()
-
-            top_result = query_index(combined_text, k=1)
-            if top_result and top_result[0]["meta"] is not None:
-                match = top_result[0]
-                # Option 1: overwrite title/description directly with match fields
-                rec["title"] = match["matched_title"]
-                rec["description"] = match["matched_description"]
+            pending_recs.append((rec, f"title: {title}; description: {desc}".strip()))
 
     # write modified gpt_output back in case it was a string originally
     entry["gpt_output"] = gpt_output
 
+print(f"Matching {len(pending_recs)} recommendations in one batch...")
+top_results = query_index_batch([text for _, text in pending_recs], k=1)
+
+# Scatter matches back into each entry's final_product_recommendations
+skipped = 0
+for (rec, _), top_result in zip(pending_recs, top_results):
+    if top_result and top_result[0]["meta"] is not None:
+        match = top_result[0]
+        if MIN_SIMILARITY is not None and match["score"] < MIN_SIMILARITY:
+            skipped += 1
+            continue
+        # Option 1: overwrite title/description directly with match fields
+        rec["title"] = match["matched_title"]
+        rec["description"] = match["matched_description"]
+
 # Save to new file
-with open(output_path, 'w') as f:
-    json.dump(data, f, indent=4)
+output_path = write_records(data, output_path)
+
+store.close()
 
 print(f"\nProcessed {len(data)} entries")
+if MIN_SIMILARITY is not None:
+    print(f"Kept {skipped} of {len(pending_recs)} recommendations unmatched (similarity below {MIN_SIMILARITY})")
 print(f"Output saved to: {output_path}")
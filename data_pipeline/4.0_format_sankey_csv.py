@@ -1,196 +1,247 @@
 import json
 import csv
+import os
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterator
+import pandas as pd
+import pyarrow as pa
+from storage import TABLE_FORMAT, TableWriter, iter_records, with_format
+
+# CSV columns
+FIELDNAMES = [
+    'combined_col',
+    'inference',
+    'inference_key',
+    'category',
+    'activity',
+    'reason',
+    'recommended_product',
+    'uncommonness',
+    'sensitivity',
+    'overall_recommended_product'
+]
+SCORE_COLUMNS = ('uncommonness', 'sensitivity')
+PARQUET_SCHEMA = pa.schema([(col, pa.int64() if col in SCORE_COLUMNS else pa.string()) for col in FIELDNAMES])
+CHUNK_ROWS = 50_000  # rows buffered per Parquet row group; csv rows are written as they are produced
+DERIVED_CACHE_SIZE = 100_000  # inference texts whose keywords / category hint are remembered
+
+STOP_WORDS = {'the', 'a', 'an', 'in', 'of', 'to', 'and', 'or', 'is', 'are', 'on', 'at', 'for', 'interested'}
+
+
+@lru_cache(maxsize=DERIVED_CACHE_SIZE)
+def extract_keywords(text: str, max_keywords: int = 5) -> str:
+    """Extract keywords from inference text for inference_key field"""
+    if not text:
+        return "[]"
+
+    words = text.lower().split()
+    keywords = [w.strip('.,!?') for w in words
+               if len(w) > 2 and w.lower() not in STOP_WORDS]
+    keywords = keywords[:max_keywords]
+
+    return str(keywords).replace("'", '"')
+
+
+@lru_cache(maxsize=DERIVED_CACHE_SIZE)
+def category_hint(inference_text: str) -> str:
+    """Derive a category for RAG data from the end of the inference text"""
+    hint = inference_text.split(' in ')[-1] if ' in ' in inference_text else inference_text
+    hint = hint.split(' and ')[-1] if ' and ' in hint else hint
+    category = hint.strip() if hint else 'General Interest'
+    if category.lower().startswith('interested'):
+        return 'General Interest'
+    return ' '.join(word.capitalize() for word in category.split())
+
+
+def rag_entry_rows(entry: Dict) -> Iterator[Dict]:
+    """
+    Rows of one RAG JSON entry - these are missing category/activity/reason.
+    Each inference is paired with all final_product_recommendations.
+    """
+    combined_cols = entry.get('combined_cols', [])
+    combined_col_str = ' AND '.join(combined_cols) if combined_cols else 'N/A'
+
+    gpt_output = entry.get('gpt_output', {})
+    inferences_list = gpt_output.get('inferences', [])
+    recommendations_list = gpt_output.get('final_product_recommendations', [])
+
+    overall_product = ''
+    if recommendations_list:
+        overall_product = recommendations_list[0].get('title', '')
+
+    for inference_obj in inferences_list:
+        inference_text = inference_obj.get('inference', '')
+        row = {
+            'combined_col': combined_col_str,
+            'inference': inference_text,
+            'inference_key': extract_keywords(inference_text),
+            'category': category_hint(inference_text),
+            'activity': inference_text,
+            'reason': inference_obj.get('explanation', ''),
+            'recommended_product': '',
+            'uncommonness': str(inference_obj.get('uncommonness', '')),
+            'sensitivity': str(inference_obj.get('sensitivity', '')),
+            'overall_recommended_product': overall_product
+        }
+        # Pair this inference with **all recommendations**, or add it once if there are none
+        for rec in recommendations_list or [None]:
+            yield dict(row, recommended_product=rec.get('title', '')) if rec is not None else row
+
+
+def cat_entry_rows(entry: Dict) -> Iterator[Dict]:
+    """
+    Rows of one CAT JSON entry - these already have all fields.
+    """
+    combined_cols = entry.get('combined_cols', [])
+    combined_col_str = ' AND '.join(combined_cols) if combined_cols else 'N/A'
+
+    gpt_output = entry.get('gpt_output', {})
+    inferences_list = gpt_output.get('inferences', [])
+    recommendations_list = gpt_output.get('final_product_recommendations', [])
+
+    overall_product = ''
+    if recommendations_list:
+        overall_product = recommendations_list[0].get('title', '')
+
+    for idx, inference_obj in enumerate(inferences_list):
+        recommended_product = ''
+        if idx < len(recommendations_list):
+            recommended_product = recommendations_list[idx].get('title', '')
+
+        yield {
+            'combined_col': combined_col_str,
+            'inference': inference_obj.get('inference', ''),
+            'inference_key': extract_keywords(inference_obj.get('inference', '')),
+            'category': inference_obj.get('category', ''),
+            'activity': inference_obj.get('activity', ''),
+            'reason': inference_obj.get('reason', ''),
+            'recommended_product': recommended_product,
+            'uncommonness': str(inference_obj.get('uncommonness', '')),
+            'sensitivity': str(inference_obj.get('sensitivity', '')),
+            'overall_recommended_product': overall_product
+        }
+
+
+class RowSink:
+    """
+    Write rows to the csv as they come, or in CHUNK_ROWS row groups for Parquet
+    (with integer scores), so only one entry's rows and one chunk are held in memory.
+    Used as a context manager, the file is deleted if the block raises.
+    """
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self.rows = 0
+        if fmt == 'parquet':
+            self._chunk = []
+            self._writer = TableWriter(path, fmt=fmt, schema=PARQUET_SCHEMA)
+        else:
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=FIELDNAMES, quoting=csv.QUOTE_MINIMAL)
+            self._writer.writeheader()
+
+    def write(self, row: Dict) -> None:
+        self.rows += 1
+        if self.fmt != 'parquet':
+            self._writer.writerow(row)
+            return
+        self._chunk.append(row)
+        if len(self._chunk) >= CHUNK_ROWS:
+            self._flush()
+
+    def _flush(self) -> None:
+        df = pd.DataFrame(self._chunk, columns=FIELDNAMES)
+        for col in SCORE_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+        self._writer.write(df)
+        self._chunk = []
+
+    def close(self) -> None:
+        if self.fmt == 'parquet':
+            if self._chunk or not self._writer.rows:
+                self._flush()
+            self._writer.close()
+        else:
+            self._file.close()
+
+    def abort(self) -> None:
+        """Close without flushing the buffered chunk and delete the partial file."""
+        if self.fmt == 'parquet':
+            self._writer.close()
+        else:
+            self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            return
+        try:
+            self.close()  # flushing the last Parquet chunk can still fail
+        except BaseException:
+            self.abort()
+            raise
+
 
 def convert_json_to_csv_fixed(rag_json_path: str, cat_json_path: str, output_csv_path: str) -> None:
     """
-    Convert data from new_inferences_rag.json and inferences_with_cat.json 
+    Convert data from new_inferences_rag.json and inferences_with_cat.json
     to CSV format matching user_data_extended_v8.csv structure.
-    
+
     This version properly handles:
     - RAG data: Only has inference, uncommonness, sensitivity, and explanation
     - Cat data: Has all fields including category, activity, reason
-    
+
     For RAG data, derives category/activity/reason from the inference text.
-    
+    Both files are streamed one entry at a time and rows are written as they
+    are produced, so memory does not grow with the size of the inputs.
+
     Args:
         rag_json_path: Path to new_inferences_rag.json
         cat_json_path: Path to inferences_with_cat.json
         output_csv_path: Output CSV file path
     """
-    
-    # Load JSON files
-    print(f"Loading {rag_json_path}...")
-    with open(rag_json_path, 'r', encoding='utf-8') as f:
-        rag_data = json.load(f)
-    
-    print(f"Loading {cat_json_path}...")
-    with open(cat_json_path, 'r', encoding='utf-8') as f:
-        cat_data = json.load(f)
-    
-    def extract_keywords(text: str, max_keywords: int = 5) -> str:
-        """Extract keywords from inference text for inference_key field"""
-        if not text:
-            return "[]"
-        
-        stop_words = {'the', 'a', 'an', 'in', 'of', 'to', 'and', 'or', 'is', 'are', 'on', 'at', 'for', 'interested'}
-        words = text.lower().split()
-        keywords = [w.strip('.,!?') for w in words 
-                   if len(w) > 2 and w.lower() not in stop_words]
-        keywords = keywords[:max_keywords]
-        
-        return str(keywords).replace("'", '"')
-    
-    def flatten_rag_entries(json_data: List[Dict]) -> List[Dict]:
-        """
-        Flatten RAG JSON entries - these are missing category/activity/reason.
-        Each inference is paired with all final_product_recommendations.
-        """
-        rows = []
-
-        for entry in json_data:
-            combined_cols = entry.get('combined_cols', [])
-            combined_col_str = ' AND '.join(combined_cols) if combined_cols else 'N/A'
-
-            gpt_output = entry.get('gpt_output', {})
-            inferences_list = gpt_output.get('inferences', [])
-            recommendations_list = gpt_output.get('final_product_recommendations', [])
-
-            overall_product = ''
-            if recommendations_list:
-                overall_product = recommendations_list[0].get('title', '')
-
-            for inference_obj in inferences_list:
-                inference_text = inference_obj.get('inference', '')
-                explanation = inference_obj.get('explanation', '')
-
-                # Extract category from inference text
-                category_hint = inference_text.split(' in ')[-1] if ' in ' in inference_text else inference_text
-                category_hint = category_hint.split(' and ')[-1] if ' and ' in category_hint else category_hint
-                category = category_hint.strip() if category_hint else 'General Interest'
-                if category.lower().startswith('interested'):
-                    category = 'General Interest'
-                else:
-                    category = ' '.join(word.capitalize() for word in category.split())
-
-                # Pair this inference with **all recommendations**
-                if recommendations_list:
-                    for rec in recommendations_list:
-                        row = {
-                            'combined_col': combined_col_str,
-                            'inference': inference_text,
-                            'inference_key': extract_keywords(inference_text),
-                            'category': category,
-                            'activity': inference_text,
-                            'reason': explanation,
-                            'recommended_product': rec.get('title', ''),
-                            'uncommonness': str(inference_obj.get('uncommonness', '')),
-                            'sensitivity': str(inference_obj.get('sensitivity', '')),
-                            'overall_recommended_product': overall_product
-                        }
-                        rows.append(row)
-                else:
-                    # No recommendations, still add row
-                    row = {
-                        'combined_col': combined_col_str,
-                        'inference': inference_text,
-                        'inference_key': extract_keywords(inference_text),
-                        'category': category,
-                        'activity': inference_text,
-                        'reason': explanation,
-                        'recommended_product': '',
-                        'uncommonness': str(inference_obj.get('uncommonness', '')),
-                        'sensitivity': str(inference_obj.get('sensitivity', '')),
-                        'overall_recommended_product': overall_product
-                    }
-                    rows.append(row)
-
-        return rows
-    
-    def flatten_cat_entries(json_data: List[Dict]) -> List[Dict]:
-        """
-        Flatten CAT JSON entries - these already have all fields.
-        """
-        rows = []
-        
-        for entry in json_data:
-            combined_cols = entry.get('combined_cols', [])
-            combined_col_str = ' AND '.join(combined_cols) if combined_cols else 'N/A'
-            
-            gpt_output = entry.get('gpt_output', {})
-            inferences_list = gpt_output.get('inferences', [])
-            recommendations_list = gpt_output.get('final_product_recommendations', [])
-            
-            for idx, inference_obj in enumerate(inferences_list):
-                recommended_product = ''
-                if idx < len(recommendations_list):
-                    recommended_product = recommendations_list[idx].get('title', '')
-                
-                overall_product = ''
-                if recommendations_list:
-                    overall_product = recommendations_list[0].get('title', '')
-                
-                row = {
-                    'combined_col': combined_col_str,
-                    'inference': inference_obj.get('inference', ''),
-                    'inference_key': extract_keywords(inference_obj.get('inference', '')),
-                    'category': inference_obj.get('category', ''),
-                    'activity': inference_obj.get('activity', ''),
-                    'reason': inference_obj.get('reason', ''),
-                    'recommended_product': recommended_product,
-                    'uncommonness': str(inference_obj.get('uncommonness', '')),
-                    'sensitivity': str(inference_obj.get('sensitivity', '')),
-                    'overall_recommended_product': overall_product
-                }
-                rows.append(row)
-        
-        return rows
-    
-    # Process both datasets
-    print("Processing RAG data (deriving category/activity/reason from explanation)...")
-    rag_rows = flatten_rag_entries(rag_data)
-    
-    print("Processing Cat data (using existing category/activity/reason)...")
-    cat_rows = flatten_cat_entries(cat_data)
-    
-    # Combine all rows
-    all_rows = rag_rows + cat_rows
-    
-    # CSV columns
-    fieldnames = [
-        'combined_col',
-        'inference',
-        'inference_key',
-        'category',
-        'activity',
-        'reason',
-        'recommended_product',
-        'uncommonness',
-        'sensitivity',
-        'overall_recommended_product'
-    ]
-    
-    # Write CSV
-    print(f"Writing to {output_csv_path}...")
-    with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_MINIMAL)
-        writer.writeheader()
-        writer.writerows(all_rows)
-    
+    output_csv_path = with_format(output_csv_path, TABLE_FORMAT)
+    # Write to a temp file first so an interrupted run never leaves a table that looks finished
+    tmp_path = output_csv_path + '.part'
+    sample = None
+    with RowSink(tmp_path, TABLE_FORMAT) as sink:
+        print(f"Streaming {rag_json_path} (deriving category/activity/reason from explanation)...")
+        for entry in iter_records(rag_json_path):
+            for row in rag_entry_rows(entry):
+                if sample is None:
+                    sample = row
+                sink.write(row)
+        rag_count = sink.rows
+
+        print(f"Streaming {cat_json_path} (using existing category/activity/reason)...")
+        for entry in iter_records(cat_json_path):
+            for row in cat_entry_rows(entry):
+                sink.write(row)
+        cat_count = sink.rows - rag_count
+    os.replace(tmp_path, output_csv_path)
+
     # Summary
     print(f"\n✓ Conversion complete!")
     print(f"  Output file: {output_csv_path}")
-    print(f"  Total rows: {len(all_rows)}")
-    print(f"    - From RAG data: {len(rag_rows)}")
-    print(f"    - From Cat data: {len(cat_rows)}")
-    
+    print(f"  Total rows: {sink.rows}")
+    print(f"    - From RAG data: {rag_count}")
+    print(f"    - From Cat data: {cat_count}")
+    keywords_info = extract_keywords.cache_info()
+    print(f"  Keywords derived for {keywords_info.misses} inference texts, reused {keywords_info.hits} times")
+
     # Show sample
-    if all_rows:
+    if sample is not None:
         print(f"\n  Sample row (RAG):")
-        print(f"    Category: {rag_rows[0]['category']}")
-        print(f"    Activity: {rag_rows[0]['activity']}")
-        print(f"    Reason: {rag_rows[0]['reason'][:80]}...")
+        print(f"    Category: {sample['category']}")
+        print(f"    Activity: {sample['activity']}")
+        print(f"    Reason: {sample['reason'][:80]}...")
 
 
 def main():
@@ -198,16 +249,13 @@ def main():
     RAG_JSON_PATH = '/scratch/cjpenni/departmental-honors/data_pipeline/inference_data/06OCT2025/new_inferences_rag.json'
     CAT_JSON_PATH = '/scratch/cjpenni/departmental-honors/data_pipeline/inferences_with_cat.json'
     OUTPUT_CSV_PATH = '/scratch/cjpenni/departmental-honors/data_pipeline/combined_inferences.csv'
-    
-    # Verify input files exist
-    if not Path(RAG_JSON_PATH).exists():
-        print(f"Error: {RAG_JSON_PATH} not found")
-        return
-    
-    if not Path(CAT_JSON_PATH).exists():
-        print(f"Error: {CAT_JSON_PATH} not found")
-        return
-    
+
+    # Verify input files exist (either as .json or .jsonl)
+    for path in (RAG_JSON_PATH, CAT_JSON_PATH):
+        if not any(Path(path).with_suffix(ext).exists() for ext in ('.json', '.jsonl')):
+            print(f"Error: {path} not found")
+            return
+
     try:
         convert_json_to_csv_fixed(RAG_JSON_PATH, CAT_JSON_PATH, OUTPUT_CSV_PATH)
     except json.JSONDecodeError as e:
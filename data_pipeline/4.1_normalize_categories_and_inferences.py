@@ -1,7 +1,11 @@
+import argparse
+import json
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
-from sklearn.cluster import AgglomerativeClustering
-from sklearn.preprocessing import normalize
+from sentence_transformers import SentenceTransformer
+from clustering import BACKENDS, cluster_unique, cut_tree, linkage_tree, pick_representatives
+from embedding_cache import EmbeddingCache, encode_unique
+from storage import TABLE_FORMAT, read_table, write_table
 
 # ========== CONFIGURATION ==========
 INPUT_CSV = "combined_inferences.csv"
@@ -10,52 +14,114 @@ INFERENCE_COL = "inference"
 OUTPUT_CSV = "unified_output.csv"
 CATEGORY_THRESHOLD = 0.65
 INFERENCE_THRESHOLD = 0.0
+MODEL_NAME = 'all-MiniLM-L6-v2'
+USE_EMBEDDING_CACHE = True  # reuse vectors from earlier runs, see embedding_cache.py
+# "agglomerative" (exact, O(n^2) memory), or the kNN-based "graph" / "leader" for large inputs, see clustering.py
+CLUSTER_BACKEND = "agglomerative"
+# --sweep cuts one dendrogram per column at every one of these thresholds
+SWEEP_THRESHOLDS = [round(0.05 * i, 2) for i in range(0, 20)]
+SWEEP_TOP_CLUSTERS = 5  # largest clusters whose representatives are reported per threshold
+SWEEP_REPORT = "threshold_sweep.json"
+
+parser = argparse.ArgumentParser(description="Merge semantically similar categories and inferences.")
+parser.add_argument('--category-threshold', type=float, default=CATEGORY_THRESHOLD)
+parser.add_argument('--inference-threshold', type=float, default=INFERENCE_THRESHOLD)
+parser.add_argument('--backend', choices=BACKENDS, default=CLUSTER_BACKEND,
+                    help='Clustering method, see clustering.py. --sweep always uses the exact average-linkage tree.')
+parser.add_argument('--sweep', action='store_true',
+                    help=f"Report cluster counts and representatives at every threshold in --thresholds "
+                         f"(saved to {SWEEP_REPORT}), then write the cut at the chosen thresholds.")
+parser.add_argument('--thresholds', type=float, nargs='+', default=SWEEP_THRESHOLDS,
+                    help='Distance thresholds to report in --sweep mode.')
+args = parser.parse_args()
 
 # ========== LOAD DATA ==========
-df = pd.read_csv(INPUT_CSV)
+df = read_table(INPUT_CSV)
 print(f"Loaded {len(df)} rows from {INPUT_CSV}")
 print(f"Unique categories before unification: {df[CATEGORY_COL].nunique()}")
 print(f"Unique inferences before unification: {df[INFERENCE_COL].nunique()}")
 
 # ========== INITIALIZE MODEL ==========
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Loaded on first use only, a run where every string is cached never loads it
+model = None
+def get_model():
+    global model
+    if model is None:
+        model = SentenceTransformer(MODEL_NAME)
+    return model
+
+embedding_cache = EmbeddingCache() if USE_EMBEDDING_CACHE else None
 
 # --------- FUNCTION TO SEMANTICALLY CLUSTER AND UNIFY A COLUMN ---------
-def unify_column(entries, distance_threshold):
-    entries = [str(e) for e in entries]  # ensure strings
-    embeddings = model.encode(entries, convert_to_tensor=True)
-    embeddings_np = normalize(embeddings.cpu().numpy())
-
-    clustering = AgglomerativeClustering(
-        n_clusters=None,
-        distance_threshold=distance_threshold,
-        metric='cosine',
-        linkage='average'
-    )
-    clustering.fit(embeddings_np)
-    cluster_labels = clustering.labels_
-
-    cluster_map = {}
-    for cluster_id in set(cluster_labels):
-        cluster_entries = [entries[i] for i in range(len(entries)) if cluster_labels[i] == cluster_id]
-        cluster_embeds = model.encode(cluster_entries, convert_to_tensor=True)
-        cosine_scores = util.cos_sim(cluster_embeds, cluster_embeds)
-        avg_scores = cosine_scores.mean(dim=1)
-        rep = cluster_entries[avg_scores.argmax().item()]
-        cluster_map[cluster_id] = rep
-
-    unified_entries = [cluster_map[cluster_labels[i]] for i in range(len(entries))]
+def encode_column(entries):
+    # Every distinct string is embedded and clustered once, weighted by how often it occurs
+    unique, unique_embeddings, inverse = encode_unique(entries, MODEL_NAME, get_model, embedding_cache)
+    counts = np.bincount(inverse, minlength=len(unique))
+    return unique, unique_embeddings, inverse, counts
+
+def apply_clusters(unique, unique_embeddings, inverse, counts, cluster_labels):
+    cluster_map = {cluster_id: unique[idx]
+                   for cluster_id, idx in pick_representatives(unique_embeddings, cluster_labels, counts).items()}
+
+    unified_entries = [cluster_map[cluster_labels[i]] for i in inverse]
     return unified_entries
 
-# ========== UNIFY CATEGORIES ==========
-df[CATEGORY_COL] = unify_column(df[CATEGORY_COL], CATEGORY_THRESHOLD)
-print(f"Unique categories after unification: {df[CATEGORY_COL].nunique()}")
+def unify_column(entries, distance_threshold, backend=CLUSTER_BACKEND):
+    unique, unique_embeddings, inverse, counts = encode_column(entries)
+    cluster_labels = cluster_unique(unique_embeddings, counts, distance_threshold, backend=backend)
+    return apply_clusters(unique, unique_embeddings, inverse, counts, cluster_labels)
 
-# ========== UNIFY INFERENCES (AND ADD "interested in") ==========
-df[INFERENCE_COL] = unify_column(df[INFERENCE_COL], INFERENCE_THRESHOLD)
+def sweep_column(name, entries, thresholds, chosen_threshold):
+    """
+    Build one average-linkage tree of the column, weighted by row like the
+    agglomerative backend, and cut it at every threshold. Returns the entries
+    unified at chosen_threshold and the report.
+    """
+    unique, unique_embeddings, inverse, counts = encode_column(entries)
+    tree = linkage_tree(unique_embeddings, counts)
+    report = []
+    print(f"\n{name}: {len(unique)} unique strings")
+    for threshold in thresholds:
+        cluster_labels = cut_tree(tree, threshold)
+        reps = pick_representatives(unique_embeddings, cluster_labels, counts)
+        sizes = np.bincount(cluster_labels, weights=counts)
+        largest = sorted(reps, key=lambda cluster_id: -sizes[cluster_id])[:SWEEP_TOP_CLUSTERS]
+        report.append({
+            "threshold": threshold,
+            "clusters": len(reps),
+            "largest_clusters": [{"representative": unique[reps[c]], "rows": int(sizes[c])} for c in largest],
+        })
+        print(f"  {threshold:.2f}: {len(reps):6d} clusters, largest: "
+              + "; ".join(f"{unique[reps[c]]} ({int(sizes[c])})" for c in largest))
+    cluster_labels = cut_tree(tree, chosen_threshold)
+    return apply_clusters(unique, unique_embeddings, inverse, counts, cluster_labels), report
+
+if args.sweep:
+    # ========== THRESHOLD SWEEP (ONE TREE PER COLUMN) ==========
+    df[CATEGORY_COL], category_report = sweep_column(CATEGORY_COL, df[CATEGORY_COL], args.thresholds, args.category_threshold)
+    df[INFERENCE_COL], inference_report = sweep_column(INFERENCE_COL, df[INFERENCE_COL], args.thresholds, args.inference_threshold)
+    with open(SWEEP_REPORT, 'w', encoding='utf-8') as f:
+        json.dump({CATEGORY_COL: category_report, INFERENCE_COL: inference_report}, f, indent=4, ensure_ascii=False)
+    print(f"\nSweep report saved to {SWEEP_REPORT}")
+    print(f"Writing the cut at {CATEGORY_COL} {args.category_threshold}, {INFERENCE_COL} {args.inference_threshold}")
+    print(f"Unique categories after unification: {df[CATEGORY_COL].nunique()}")
+else:
+    # ========== UNIFY CATEGORIES ==========
+    df[CATEGORY_COL] = unify_column(df[CATEGORY_COL], args.category_threshold, backend=args.backend)
+    print(f"Unique categories after unification: {df[CATEGORY_COL].nunique()}")
+
+    # ========== UNIFY INFERENCES ==========
+    df[INFERENCE_COL] = unify_column(df[INFERENCE_COL], args.inference_threshold, backend=args.backend)
+
+# ========== ADD "interested in" ==========
 df[INFERENCE_COL] = df[INFERENCE_COL].apply(lambda x: f"interested in {x}" if not x.lower().startswith("interested in") else x)
 print(f"Unique inferences after unification: {df[INFERENCE_COL].nunique()}")
 
+if embedding_cache is not None:
+    embedding_cache.close()
+
 # ========== SAVE OUTPUT ==========
-df.to_csv(OUTPUT_CSV, index=False)
+df.to_csv(OUTPUT_CSV, index=False)  # 4.2_export_sankey_graph.py always reads the csv
 print(f"Done! Output saved to {OUTPUT_CSV}")
+if TABLE_FORMAT == 'parquet':
+    print(f"Parquet copy saved to {write_table(df, OUTPUT_CSV)}")
@@ -0,0 +1,96 @@
+import json
+import re
+import pandas as pd
+
+# ========== CONFIGURATION ==========
+INPUT_CSV = "unified_output.csv"  # output of 4.1
+OUTPUT_JSON = "sankey_graph.json"  # read by sankey_d3.html
+REC_LABEL_LENGTH = 80  # recommendations are shown truncated, with the full title as tooltip
+FACETS = ['category', 'sensitivity', 'uncommonness', 'sources']  # one link group per combination of filter values
+SOURCE_SPLIT = re.compile(r'\s+AND\s+', re.IGNORECASE)
+
+
+def truncate_text(text, max_length=REC_LABEL_LENGTH):
+    return text if len(text) <= max_length else text[:max_length] + '...'
+
+
+def numeric_order(values):
+    """Sort filter values as numbers, like the page did, with non-numbers last."""
+    def key(value):
+        try:
+            return (0, float(value))
+        except ValueError:
+            return (1, 0.0)
+    return sorted(values, key=key)
+
+
+def build_graph(df):
+    """
+    Aggregate the rows into weighted links, grouped by every combination of
+    filter values that occurs. The page only sums the links of the groups that
+    match the current filters, so it never touches individual rows.
+
+    Each group is [category, sensitivity, uncommonness, [source ids],
+    [source, inference, weight, ...], [inference, recommendation, weight, ...]],
+    with every value an index into the lists next to "groups".
+    """
+    df = df.copy()
+    # Same labels the page built per row: capitalized inference, truncated recommendation
+    df['inference'] = df['inference'].str[:1].str.upper() + df['inference'].str[1:]
+    df['rec_label'] = df['recommended_product'].map(truncate_text)
+    df['sources'] = df['combined_col'].map(lambda value: tuple(s.strip() for s in SOURCE_SPLIT.split(value)))
+
+    categories = sorted(df['category'].unique())
+    sensitivities = numeric_order(df['sensitivity'].unique())
+    uncommonness = numeric_order(df['uncommonness'].unique())
+    df['category'] = df['category'].map({v: i for i, v in enumerate(categories)})
+    df['sensitivity'] = df['sensitivity'].map({v: i for i, v in enumerate(sensitivities)})
+    df['uncommonness'] = df['uncommonness'].map({v: i for i, v in enumerate(uncommonness)})
+
+    df['inference'], inferences = pd.factorize(df['inference'])
+    df['rec_label'], rec_labels = pd.factorize(df['rec_label'])
+    # Recommendations that truncate to the same label share a node titled after the first one
+    rec_titles = df.groupby('rec_label', sort=True)['recommended_product'].first()
+    _, sources = pd.factorize(df['sources'].explode())
+    source_lookup = {source: i for i, source in enumerate(sources)}
+    df['sources'] = df['sources'].map(lambda row_sources: tuple(source_lookup[s] for s in row_sources))
+
+    # source -> inference, once per source of the row
+    source_links = df[FACETS + ['inference']].assign(source=df['sources']).explode('source', ignore_index=True)
+    source_links = source_links.groupby(FACETS + ['source', 'inference'], sort=False).size()
+    rec_links = df.groupby(FACETS + ['inference', 'rec_label'], sort=False).size()
+
+    groups = {}
+    for (*facet, source, inference), weight in source_links.items():
+        groups.setdefault(tuple(facet), ([], []))[0].extend((int(source), int(inference), int(weight)))
+    for (*facet, inference, rec), weight in rec_links.items():
+        groups.setdefault(tuple(facet), ([], []))[1].extend((int(inference), int(rec), int(weight)))
+
+    return {
+        "rows": len(df),
+        "categories": categories,
+        "sensitivities": list(sensitivities),
+        "uncommonness": list(uncommonness),
+        "sources": list(sources),
+        "inferences": list(inferences),
+        "recommendations": [[label, rec_titles[i]] for i, label in enumerate(rec_labels)],
+        "groups": [[int(c), int(s), int(u), list(srcs), src_links, inf_links]
+                   for (c, s, u, srcs), (src_links, inf_links) in groups.items()],
+    }
+
+
+def main():
+    # Read every value as text, exactly as d3.csvParse does in the page
+    df = pd.read_csv(INPUT_CSV, dtype=str, keep_default_na=False)
+    print(f"Loaded {len(df)} rows from {INPUT_CSV}")
+    graph = build_graph(df)
+    with open(OUTPUT_JSON, 'w', encoding='utf-8') as f:
+        json.dump(graph, f, ensure_ascii=False, separators=(',', ':'))
+    links = sum(len(group[4]) + len(group[5]) for group in graph["groups"]) // 3
+    print(f"{len(graph['groups'])} filter groups, {links} weighted links "
+          f"({len(graph['inferences'])} inferences, {len(graph['recommendations'])} recommendations)")
+    print(f"Done! Sankey graph saved to {OUTPUT_JSON}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import multiprocessing as mp
+import resource
+import time
+import numpy as np
+from sklearn.metrics import adjusted_rand_score
+from clustering import BACKENDS, cluster_unique
+
+# ========== CONFIGURATION ==========
+NUM_THEMES = 12  # broad themes, e.g. "Health & Fitness"
+NUM_TOPICS = 60  # narrower topics inside the themes, e.g. "Pilates"
+NUM_UNIQUE = 2000  # distinct strings
+MEAN_COPIES = 4  # average number of rows per distinct string (Zipf-like)
+DIM = 384  # all-MiniLM-L6-v2 embedding size
+TOPIC_SPREAD = 1.0  # how far topics sit from their theme
+NOISE = 0.8  # how far strings sit from their topic
+DISTANCE_THRESHOLD = 0.65  # CATEGORY_THRESHOLD in 4.1
+
+
+def make_data(num_unique, seed=0):
+    """Normalized vectors of distinct strings drawn around nested themes and topics, and their row counts."""
+    rng = np.random.default_rng(seed)
+    themes = rng.standard_normal((NUM_THEMES, DIM))
+    topics = themes[rng.integers(NUM_THEMES, size=NUM_TOPICS)] + TOPIC_SPREAD * rng.standard_normal((NUM_TOPICS, DIM))
+    vectors = topics[rng.integers(NUM_TOPICS, size=num_unique)] + NOISE * rng.standard_normal((num_unique, DIM))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    counts = np.minimum(rng.zipf(1.8, size=num_unique), 20 * MEAN_COPIES)
+    counts = np.maximum(1, np.round(counts * MEAN_COPIES / counts.mean())).astype(np.int64)
+    return vectors, counts
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is in KB on Linux
+
+
+def run_backend(backend, vectors, counts, threshold, queue):
+    # Runs in a fresh child so peak memory is measured per backend
+    start_rss = peak_rss_mb()
+    start = time.perf_counter()
+    labels = cluster_unique(vectors, counts, threshold, backend=backend)
+    queue.put((labels, time.perf_counter() - start, peak_rss_mb() - start_rss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the 4.1 clustering backends on synthetic embeddings.")
+    parser.add_argument('--unique', type=int, default=NUM_UNIQUE, help='Distinct strings to cluster.')
+    parser.add_argument('--threshold', type=float, default=DISTANCE_THRESHOLD, help='Cosine distance threshold.')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    vectors, counts = make_data(args.unique)
+    rows = np.repeat(np.arange(len(counts)), counts)
+    print(f"{len(vectors)} unique strings, {len(rows)} rows, threshold {args.threshold}")
+
+    ctx = mp.get_context('fork')
+    reference = None
+    for backend in args.backends:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=run_backend, args=(backend, vectors, counts, args.threshold, queue))
+        proc.start()
+        labels, seconds, peak_mb = queue.get()
+        proc.join()
+        if reference is None:
+            reference = labels
+        # Agreement is measured per row, so frequent strings count as often as they occur
+        agreement = adjusted_rand_score(reference[rows], labels[rows])
+        print(f"{backend:>14}: {len(np.unique(labels)):5d} clusters, {seconds:7.2f}s, "
+              f"+{peak_mb:7.1f} MB peak RSS, ARI vs {args.backends[0]} {agreement:.3f}")
+
+
+if __name__ == "__main__":
+    main()
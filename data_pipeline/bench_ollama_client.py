@@ -0,0 +1,52 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ollama_client import OllamaClient
+
+# ========== CONFIGURATION ==========
+MOCK_LATENCY_S = 0.5  # simulated generation time per request
+NUM_PROMPTS = 15  # combo_sizes [1,2,3,4] over 4 columns
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    """Streams a fake /api/generate reply after a fixed delay."""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length))
+        time.sleep(MOCK_LATENCY_S)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        for chunk in ["echo: ", payload["prompt"]]:
+            self.wfile.write((json.dumps({"response": chunk, "done": False}) + "\n").encode("utf-8"))
+        self.wfile.write((json.dumps({"response": "", "done": True}) + "\n").encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+    prompts = [f"prompt {i}" for i in range(NUM_PROMPTS)]
+    expected = [f"echo: {p}" for p in prompts]
+
+    baseline = None
+    for workers in WORKER_COUNTS:
+        with OllamaClient(url, "mock", max_workers=workers) as client:
+            start = time.perf_counter()
+            replies = client.run_prompts(prompts)
+            elapsed = time.perf_counter() - start
+        assert replies == expected, "replies came back out of order"
+        baseline = baseline or elapsed
+        print(f"workers={workers}: {elapsed:.2f}s for {NUM_PROMPTS} prompts ({baseline / elapsed:.1f}x)")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
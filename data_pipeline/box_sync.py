@@ -0,0 +1,125 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# ---- SYNC CONFIG ----
+MANIFEST_NAME = 'box_manifest.json'  # written next to the downloaded files
+DOWNLOAD_WORKERS = 4  # concurrent downloads
+# ---------------------
+
+
+class _HashingWriter:
+    """File wrapper that computes the sha1 of everything written through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha1 = hashlib.sha1()
+
+    def write(self, data):
+        self.sha1.update(data)
+        return self.f.write(data)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def list_html_items(client, folder_id):
+    folder = client.folder(folder_id=folder_id)
+    items = folder.get_items(fields=['type', 'id', 'name', 'sha1', 'modified_at'])
+    return [item for item in items if item.type == 'file' and item.name.lower().endswith('.html')]
+
+
+def is_unchanged(item, entry, local_path):
+    return (
+        entry is not None
+        and entry.get('sha1') == item.sha1
+        and entry.get('modified_at') == item.modified_at
+        and os.path.exists(local_path)
+    )
+
+
+def download_item(client, item, local_path):
+    """Stream one Box file to disk, verify its sha1, then move it into place."""
+    tmp_path = local_path + '.part'
+    try:
+        with open(tmp_path, 'wb') as f:
+            writer = _HashingWriter(f)
+            client.file(item.id).download_to(writer)
+    except Exception:
+        with contextlib.suppress(FileNotFoundError):  # open() itself may have failed
+            os.remove(tmp_path)
+        raise
+    sha1 = writer.sha1.hexdigest()
+    if item.sha1 and sha1 != item.sha1:
+        os.remove(tmp_path)
+        raise ValueError(f"sha1 mismatch for {item.name}: expected {item.sha1}, got {sha1}")
+    os.replace(tmp_path, local_path)
+    return sha1
+
+
+def sync_folder(client, folder_id, local_dir, workers=DOWNLOAD_WORKERS):
+    """
+    Mirror the .html files of a Box folder into local_dir.
+
+    Files whose Box sha1 and modified_at match the local manifest are skipped.
+    The rest are downloaded concurrently, and the manifest is saved after every
+    finished download so an interrupted run (e.g. an expired developer token)
+    picks up where it stopped. Returns (local paths of all synced files,
+    local paths downloaded in this run).
+    """
+    manifest_path = os.path.join(local_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    items = list_html_items(client, folder_id)
+    to_download = []
+    for item in items:
+        local_path = os.path.join(local_dir, item.name)
+        if is_unchanged(item, manifest.get(item.id), local_path):
+            print(f"Unchanged, skipping download: {item.name}")
+        else:
+            to_download.append((item, local_path))
+
+    lock = threading.Lock()
+
+    def fetch(item, local_path):
+        sha1 = download_item(client, item, local_path)
+        with lock:
+            manifest[item.id] = {
+                'name': item.name,
+                'sha1': item.sha1 or sha1,
+                'modified_at': item.modified_at,
+                'local_path': local_path,
+            }
+            save_manifest(manifest_path, manifest)
+        print(f"Downloaded {item.name}")
+        return local_path
+
+    downloaded, failed = [], []
+    if to_download:
+        with ThreadPoolExecutor(max_workers=min(workers, len(to_download))) as executor:
+            futures = {executor.submit(fetch, item, path): item for item, path in to_download}
+            for future in as_completed(futures):
+                try:
+                    downloaded.append(future.result())
+                except Exception as e:
+                    failed.append(futures[future].name)
+                    print(f"Failed to download {futures[future].name}: {e}")
+
+    synced = [manifest[item.id]['local_path'] for item in items
+              if item.id in manifest and os.path.exists(manifest[item.id]['local_path'])]
+    print(f"Box sync: {len(downloaded)} downloaded, {len(items) - len(to_download)} unchanged, {len(failed)} failed")
+    return synced, downloaded
@@ -0,0 +1,120 @@
+import contextlib
+import hashlib
+import io
+import os
+import tempfile
+from types import SimpleNamespace
+from box_sync import MANIFEST_NAME, download_item, load_manifest, sync_folder
+
+# ========== CONFIGURATION ==========
+FOLDER_ID = '0'
+
+
+class FakeBoxClient:
+    """
+    Local stand-in for boxsdk's Client with the calls box_sync makes:
+    folder(folder_id).get_items(fields) and file(file_id).download_to(writer).
+    `files` maps file id -> (name, content bytes); modified_at changes on every update.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.versions = {}
+        self.downloads = []
+        self.corrupt = set()  # ids whose download sends other bytes than their sha1 says
+        self.failing = set()  # ids whose download raises halfway
+
+    def put(self, file_id, name, content):
+        self.files[file_id] = (name, content)
+        self.versions[file_id] = self.versions.get(file_id, 0) + 1
+
+    def folder(self, folder_id):
+        return SimpleNamespace(get_items=self._get_items)
+
+    def _get_items(self, fields=None):
+        return [SimpleNamespace(type='file', id=file_id, name=name, sha1=hashlib.sha1(content).hexdigest(),
+                                modified_at=f"2025-01-01T00:00:{self.versions[file_id]:02d}Z")
+                for file_id, (name, content) in self.files.items()]
+
+    def file(self, file_id):
+        def download_to(writer):
+            self.downloads.append(file_id)
+            content = self.files[file_id][1]
+            writer.write(content[:len(content) // 2])
+            if file_id in self.failing:
+                raise ConnectionError("token expired")
+            writer.write(b'corrupted' if file_id in self.corrupt else content[len(content) // 2:])
+        return SimpleNamespace(download_to=download_to)
+
+
+def sync(client, local_dir):
+    client.downloads.clear()
+    sync_folder(client, FOLDER_ID, local_dir, workers=2)
+    return sorted(client.downloads)
+
+
+def sync_summary(client, local_dir):
+    """The last line sync_folder prints."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        sync_folder(client, FOLDER_ID, local_dir, workers=2)
+    return out.getvalue().splitlines()[-1]
+
+
+def main():
+    client = FakeBoxClient()
+    client.put('1', 'a.html', b'<html>a</html>')
+    client.put('2', 'b.html', b'<html>b</html>')
+    client.put('3', 'notes.txt', b'not html')
+
+    with tempfile.TemporaryDirectory() as local_dir:
+        def read(name):
+            with open(os.path.join(local_dir, name), 'rb') as f:
+                return f.read()
+
+        def leftovers():
+            return [name for name in os.listdir(local_dir) if name.endswith(('.part', '.tmp'))]
+
+        assert sync(client, local_dir) == ['1', '2'], "first sync should download every html file"
+        assert read('a.html') == b'<html>a</html>'
+        assert set(load_manifest(os.path.join(local_dir, MANIFEST_NAME))) == {'1', '2'}
+
+        assert sync(client, local_dir) == [], "second sync should download nothing"
+
+        client.put('2', 'b.html', b'<html>b, edited</html>')
+        assert sync(client, local_dir) == ['2'], "a changed sha1 should re-download only that file"
+        assert read('b.html') == b'<html>b, edited</html>'
+
+        os.remove(os.path.join(local_dir, 'a.html'))
+        assert sync(client, local_dir) == ['1'], "a file deleted locally should be downloaded again"
+
+        client.put('1', 'a.html', b'<html>a, edited</html>')
+        client.corrupt.add('1')
+        assert sync(client, local_dir) == ['1']
+        assert read('a.html') == b'<html>a</html>', "a download failing its sha1 check must not replace the file"
+        assert not leftovers(), f"no partial files should be left behind, found {leftovers()}"
+
+        client.corrupt.clear()
+        client.failing.add('1')
+        assert sync(client, local_dir) == ['1']
+        assert read('a.html') == b'<html>a</html>', "an interrupted download must not replace the file"
+        assert not leftovers(), f"no partial files should be left behind, found {leftovers()}"
+        summary = sync_summary(client, local_dir)
+        assert summary == "Box sync: 0 downloaded, 1 unchanged, 1 failed", f"failures are not unchanged: {summary!r}"
+
+        item = client.folder(FOLDER_ID).get_items()[0]
+        try:
+            download_item(client, item, os.path.join(local_dir, 'missing', 'a.html'))
+        except FileNotFoundError as e:
+            assert e.__context__ is None, "a .part file that was never created must not fail the cleanup"
+
+        client.failing.clear()
+        assert sync(client, local_dir) == ['1'], "a file that failed should be retried on the next run"
+        assert read('a.html') == b'<html>a, edited</html>'
+        assert sync(client, local_dir) == []
+
+    print("✓ box_sync checks passed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import sqlite3
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# ========== CONFIGURATION ==========
+CACHE_PATH = Path(__file__).resolve().parent / 'embedding_cache.sqlite'
+ENCODE_BATCH_SIZE = 256
+
+
+class EmbeddingCache:
+    """
+    Persistent text -> embedding cache stored in SQLite.
+
+    Vectors are stored L2-normalized as float32 and keyed on (model name, text),
+    so switching models never returns vectors from another embedding space.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = str(path)
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model_name, texts):
+        """{text: vector} for every text in `texts` that is cached for this model."""
+        found = {}
+        texts = list(texts)
+        for start in range(0, len(texts), 500):  # stay under SQLite's bound-parameter limit
+            chunk = texts[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT text, vector FROM embeddings WHERE model = ? AND text IN ({','.join('?' * len(chunk))})",
+                (model_name, *chunk),
+            )
+            for text, blob in rows:
+                found[text] = np.frombuffer(blob, dtype=np.float32)
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, model_name, texts, vectors):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+            ((model_name, text, np.asarray(vector, dtype=np.float32).tobytes()) for text, vector in zip(texts, vectors)),
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def encode_unique(entries, model_name, load_model, cache=None, batch_size=ENCODE_BATCH_SIZE):
+    """
+    Embed every distinct string of `entries` exactly once.
+
+    Returns (unique texts in first-seen order, (n_unique, dim) normalized float32
+    vectors, inverse) where unique[inverse] == entries. Texts found in `cache`
+    are not encoded at all, and `load_model()` is only called if something is missing.
+    """
+    inverse, unique = pd.factorize(pd.Series([str(e) for e in entries]), sort=False)
+    unique = list(unique)
+    cached = cache.get_many(model_name, unique) if cache is not None else {}
+    missing = [text for text in unique if text not in cached]
+    if missing:
+        encoded = load_model().encode(missing, batch_size=batch_size, convert_to_numpy=True,
+                                      normalize_embeddings=True).astype(np.float32)
+        cached.update(zip(missing, encoded))
+        if cache is not None:
+            cache.put_many(model_name, missing, encoded)
+    print(f"Embeddings: {len(unique)} unique of {len(inverse)} entries, "
+          f"{len(unique) - len(missing)} from cache, {len(missing)} encoded")
+    vectors = np.vstack([cached[text] for text in unique]) if unique else np.zeros((0, 0), dtype=np.float32)
+    return unique, vectors, inverse
@@ -0,0 +1,297 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
+
+# ========== CONFIGURATION ==========
+OLLAMA_URL = 'http://localhost:11434/api/generate'  # Use /api/generate for streaming
+OLLAMA_MODEL = 'gpt-oss:20b'  # Change to your preferred local model
+# Keep this in line with the OLLAMA_NUM_PARALLEL the server was started with,
+# extra in-flight requests just sit in Ollama's queue.
+OLLAMA_NUM_PARALLEL = int(os.environ.get('OLLAMA_NUM_PARALLEL', 4))
+CACHE_PATH = Path(__file__).resolve().parent / 'ollama_cache.sqlite'  # shared by stages 3.0 and 3.1
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # least recently used replies are evicted past this size
+MAX_RETRIES = 3  # failed HTTP requests are retried this many times
+RETRY_BACKOFF_SECONDS = 2  # wait before the first retry, doubled for every following one
+
+
+class OllamaError(requests.RequestException):
+    """Ollama answered with an error, e.g. a missing model. Retried like an HTTP error."""
+
+
+class PromptCache:
+    """
+    Persistent prompt/response cache stored in SQLite.
+
+    Entries are keyed on a hash of the model name, generation options and the
+    exact prompt text. When the stored replies grow past `max_bytes` the least
+    recently used ones are evicted.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, options, prompt, format=None):
+        fields = {"model": model, "options": options or {}, "prompt": prompt}
+        if format is not None:
+            fields["format"] = format  # only added when set, so free-form keys stay as they were
+        blob = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, response):
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def add_cache_args(parser):
+    """Add the --no-cache / --refresh switches shared by the inference stages."""
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the prompt/response cache.')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Ignore cached replies, re-query the model and overwrite the cache.')
+    parser.add_argument('--cache-path', default=str(CACHE_PATH),
+                        help='SQLite file used for the prompt/response cache.')
+    return parser
+
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+def validate_json(value, schema, path="$"):
+    """
+    Check `value` against the subset of JSON Schema used for Ollama's `format`
+    (type, properties, required, items, minItems/maxItems, minimum/maximum, enum).
+    Returns a list of error messages, empty when the value is valid.
+    """
+    expected = schema.get("type")
+    if expected is not None:
+        python_type = _JSON_TYPES[expected]
+        # bool is a subclass of int in Python but not a JSON number
+        if not isinstance(value, python_type) or (isinstance(value, bool) and expected != "boolean"):
+            return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing key {key!r}")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate_json(value[key], subschema, f"{path}.{key}"))
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items, got {len(value)}")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append(f"{path}: expected at most {schema['maxItems']} items, got {len(value)}")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                errors.extend(validate_json(item, schema["items"], f"{path}[{i}]"))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: {value} is below the minimum {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: {value} is above the maximum {schema['maximum']}")
+    return errors
+
+
+def cache_from_args(args):
+    if args.no_cache:
+        return None
+    return PromptCache(args.cache_path)
+
+
+class OllamaClient:
+    """
+    Thin client around Ollama's /api/generate endpoint.
+
+    Reuses one pooled HTTP session for every request and can fan a list of
+    prompts out over a bounded thread pool. Results always come back in the
+    same order as the prompts were given. If a `PromptCache` is given,
+    byte-identical prompts are answered from disk instead of the model;
+    `refresh=True` skips the lookup but still stores the new reply.
+    Connection errors, HTTP error statuses and errors reported in the stream
+    are retried with exponential backoff, and never end up in the cache.
+    Passing a JSON schema as `format` makes Ollama constrain the reply to it.
+    Use it as a context manager so the session and the cache are closed.
+    """
+
+    def __init__(self, url=OLLAMA_URL, model=OLLAMA_MODEL, max_workers=OLLAMA_NUM_PARALLEL,
+                 options=None, cache=None, refresh=False, max_retries=MAX_RETRIES, keep_alive=None):
+        self.url = url
+        self.model = model
+        self.max_workers = max(1, int(max_workers))
+        self.options = options
+        self.cache = cache
+        self.refresh = refresh
+        self.max_retries = max_retries
+        self.keep_alive = keep_alive  # how long Ollama keeps the model loaded after a request, e.g. "30m"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def run_prompt(self, prompt, refresh=None, format=None, accept=None):
+        """
+        Reply to one prompt; `refresh=True` re-asks the model even if the reply is cached,
+        and `format` (a JSON schema or "json") asks Ollama for structured output.
+        A new reply is only cached if `accept(reply)` is true (when given), so a
+        reply the caller cannot parse is asked for again on the next run.
+        """
+        if refresh is None:
+            refresh = self.refresh
+        key = None
+        if self.cache is not None:
+            key = PromptCache.make_key(self.model, self.options, prompt, format)
+            if not refresh:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+
+        reply = self._generate_with_retries(prompt, format)
+        # An empty or rejected reply is never worth replaying
+        if key is not None and reply and (accept is None or accept(reply)):
+            self.cache.put(key, reply)
+        return reply
+
+    def _generate_with_retries(self, prompt, format=None):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._generate(prompt, format)
+            except requests.RequestException as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = RETRY_BACKOFF_SECONDS * 2 ** attempt
+                print(f"⚠️ Ollama request failed ({e}), retrying in {delay}s...")
+                time.sleep(delay)
+
+    def _generate(self, prompt, format=None):
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True
+        }
+        if self.options:
+            payload["options"] = self.options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if format is not None:
+            payload["format"] = format
+        full_response = ""
+        with self.session.post(self.url, json=payload, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    data = json.loads(line.decode("utf-8"))
+                    if "error" in data:
+                        raise OllamaError(f"Ollama error: {data['error']}")
+                    if "response" in data:
+                        full_response += data["response"]
+        return full_response.strip()
+
+    def run_structured(self, prompt, schema, max_attempts=3):
+        """
+        Ask for a reply matching `schema`. Only replies that are not valid JSON or
+        do not validate are asked again, bypassing the cache so the bad reply is
+        replaced. Returns (parsed value or None, validation errors of the last try).
+        """
+        def accept(reply):
+            try:
+                return not validate_json(json.loads(reply), schema)
+            except json.JSONDecodeError:
+                return False
+
+        value, errors = None, []
+        for attempt in range(max_attempts):
+            reply = self.run_prompt(prompt, refresh=True if attempt else None, format=schema, accept=accept)
+            try:
+                value = json.loads(reply)
+            except json.JSONDecodeError as e:
+                value, errors = None, [f"reply is not valid JSON: {e}"]
+                continue
+            errors = validate_json(value, schema)
+            if not errors:
+                return value, []
+        return value, errors
+
+    def map(self, fn, items):
+        """Call `fn` on every item with at most `max_workers` in flight, preserving order."""
+        items = list(items)
+        if self.max_workers == 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(fn, items))
+
+    def run_prompts(self, prompts, accept=None):
+        """Run many prompts with at most `max_workers` in flight, preserving order."""
+        return self.map(lambda prompt: self.run_prompt(prompt, accept=accept), prompts)
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            if self.cache.hits or self.cache.misses:
+                print(f"Prompt cache: {self.cache.hits} hits, {self.cache.misses} misses")
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,144 @@
+import json
+import os
+from glob import glob
+import pandas as pd
+
+# ========== CONFIGURATION ==========
+# Format of the tables handed between stages: "csv" (default) or "parquet".
+# Parquet keeps dtypes (e.g. year stays an integer) and is much smaller and faster to read.
+TABLE_FORMAT = os.environ.get('PIPELINE_TABLE_FORMAT', 'csv')
+# Format of the LLM output files: "json" (indented, default) or "jsonl" (one compact record per line).
+RECORD_FORMAT = os.environ.get('PIPELINE_RECORD_FORMAT', 'json')
+PARQUET_COMPRESSION = 'zstd'
+
+TABLE_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet'}
+RECORD_EXTENSIONS = {'json': '.json', 'jsonl': '.jsonl'}
+
+
+def with_format(path, fmt):
+    """Swap the extension of `path` for the one of `fmt`."""
+    ext = TABLE_EXTENSIONS.get(fmt) or RECORD_EXTENSIONS[fmt]
+    return os.path.splitext(str(path))[0] + ext
+
+
+def _resolve(path, extensions, preferred):
+    """Return `path` in the preferred format if it exists, else any existing variant."""
+    candidates = [with_format(path, preferred)] + [with_format(path, fmt) for fmt in extensions if fmt != preferred]
+    for candidate in candidates + [str(path)]:
+        if os.path.exists(candidate):
+            return candidate
+    return candidates[0]
+
+
+# ---------- tables ----------
+
+def read_table(path, columns=None, fmt=None):
+    """Read a csv or parquet table; `path` may carry either extension."""
+    path = _resolve(path, TABLE_EXTENSIONS, fmt or TABLE_FORMAT)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def write_table(df, path, fmt=None):
+    """Write `df` in the configured table format and return the path actually written."""
+    fmt = fmt or TABLE_FORMAT
+    path = with_format(path, fmt)
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False, compression=PARQUET_COMPRESSION)
+    else:
+        df.to_csv(path, index=False, encoding='utf-8')
+    return path
+
+
+def list_tables(folder, fmt=None):
+    """All tables in `folder`, one per file stem, preferring the configured format."""
+    fmt = fmt or TABLE_FORMAT
+    by_stem = {}
+    for ext_fmt in sorted(TABLE_EXTENSIONS, key=lambda f: f == fmt):
+        for path in glob(os.path.join(folder, '*' + TABLE_EXTENSIONS[ext_fmt])):
+            by_stem[os.path.splitext(path)[0]] = path
+    return sorted(by_stem.values())
+
+
+class TableWriter:
+    """
+    Append DataFrame chunks to one table without holding the whole table in memory.
+    Parquet output needs an explicit pyarrow schema so every chunk has the same types.
+    """
+
+    def __init__(self, path, fmt=None, schema=None):
+        self.fmt = fmt or TABLE_FORMAT
+        self.path = path
+        self.schema = schema
+        self.rows = 0
+        self._writer = None
+
+    def write(self, df):
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema, compression=PARQUET_COMPRESSION)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='a' if self.rows else 'w', header=not self.rows, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------- LLM output records ----------
+
+def read_records(path, fmt=None):
+    """Read a list of records from an indented .json array or a .jsonl file."""
+    path = _resolve(path, RECORD_EXTENSIONS, fmt or RECORD_FORMAT)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def iter_records(path, fmt=None):
+    """
+    Yield the records of a .json array or .jsonl file one at a time, so only
+    one record is in memory. Streaming a .json array needs the ijson package.
+    Without it, the whole file is loaded as before.
+    """
+    path = _resolve(path, RECORD_EXTENSIONS, fmt or RECORD_FORMAT)
+    with open(path, 'rb') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        try:
+            import ijson
+        except ImportError:
+            print(f"⚠️ ijson is not installed, loading all of {path} into memory")
+            yield from json.load(f)
+            return
+        # use_float keeps numbers as float like json.load (ijson defaults to Decimal)
+        yield from ijson.items(f, 'item', use_float=True)
+
+
+def write_records(records, path, fmt=None, indent=4):
+    """Write records as an indented .json array or compact .jsonl and return the path written."""
+    fmt = fmt or RECORD_FORMAT
+    path = with_format(path, fmt)
+    with open(path, 'w', encoding='utf-8') as f:
+        if fmt == 'jsonl':
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        else:
+            json.dump(records, f, indent=indent, ensure_ascii=False)
+    return path
@@ -0,0 +1,130 @@
+import math
+import os
+from functools import lru_cache
+from pathlib import Path
+
+# ========== CONFIGURATION ==========
+# tokenizer.json of the model Ollama serves, loaded from disk only (no network access).
+# For gpt-oss it is the tokenizer.json file of the openai/gpt-oss-20b Hugging Face repo.
+TOKENIZER_PATH = os.environ.get('PIPELINE_TOKENIZER', str(Path(__file__).resolve().parent / 'tokenizer.json'))
+CHARS_PER_TOKEN = 4  # rough estimate used when no tokenizer file is available
+
+
+@lru_cache(maxsize=1)
+def _load_tokenizer(path=TOKENIZER_PATH):
+    if not os.path.exists(path):
+        print(f"⚠️ No tokenizer file at {path}, estimating {CHARS_PER_TOKEN} characters per token")
+        return None
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        print(f"⚠️ The tokenizers package is not installed, estimating {CHARS_PER_TOKEN} characters per token")
+        return None
+    return Tokenizer.from_file(path)
+
+
+def count_tokens(text):
+    tokenizer = _load_tokenizer()
+    if tokenizer is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+@lru_cache(maxsize=500_000)
+def item_tokens(item):
+    """Tokens one history item adds to a printed list, including its ', ' separator."""
+    return count_tokens(repr(item)) + 1
+
+
+def unique_items(items):
+    """Drop empty values and repeats (ignoring case and spacing), keeping the first occurrence."""
+    seen = set()
+    kept = []
+    for item in items:
+        if item is None or item != item:  # NaN
+            continue
+        item = str(item)
+        key = ' '.join(item.lower().split())
+        if key and key not in seen:
+            seen.add(key)
+            kept.append(item)
+    return kept
+
+
+def fair_shares(demands, budget):
+    """
+    Split `budget` tokens across columns max-min fairly: every column gets an
+    equal share, and whatever a small column does not need is handed out
+    evenly to the columns that want more.
+    """
+    shares = {}
+    remaining = dict(demands)
+    left = budget
+    while remaining:
+        share = left // len(remaining)
+        satisfied = {col: demand for col, demand in remaining.items() if demand <= share}
+        if not satisfied:
+            shares.update({col: share for col in remaining})
+            break
+        for col, demand in satisfied.items():
+            shares[col] = demand
+            left -= demand
+            del remaining[col]
+    return shares
+
+
+def truncate_list(data_list, max_tokens):
+    """Keep items in order while they fit in max_tokens, skipping any single item that is too long."""
+    truncated_list = []
+    token_count = 0
+    for item in data_list:
+        cost = item_tokens(item)
+        if token_count + cost <= max_tokens:
+            truncated_list.append(item)
+            token_count += cost
+    return truncated_list, token_count
+
+
+class HistoryDigest:
+    """
+    One column's history, cleaned once and reused by every prompt it appears in.
+
+    `items` are the deduplicated values, most recent first (Takeout lists
+    activity newest first), and `demand` is what printing all of them costs.
+    `pack` renders the most recent items that fit in a token share and
+    memoizes the result, since combinations of the same size ask for the same shares.
+    """
+
+    def __init__(self, items):
+        self.total_items = len(items)
+        self.items = unique_items(items)
+        self.demand = sum(item_tokens(item) for item in self.items)
+        self._packed = {}
+
+    def pack(self, share):
+        if share not in self._packed:
+            kept, used = truncate_list(self.items, share)
+            self._packed[share] = (str(kept), {
+                "items": self.total_items,
+                "unique_items": len(self.items),
+                "kept_items": len(kept),
+                "tokens": used,
+                "share": share,
+            })
+        return self._packed[share]
+
+
+def pack_history(digests, budget):
+    """
+    Fit the history of several columns into `budget` tokens.
+
+    `digests` maps column name to its HistoryDigest. Every column gets a fair
+    share of the budget and keeps its most recent items that fit.
+    Returns ({column: printed list of kept items}, {column: stats}).
+    """
+    shares = fair_shares({col: digest.demand for col, digest in digests.items()}, max(budget, 0))
+    packed = {}
+    stats = {}
+    for col, digest in digests.items():
+        packed[col], stats[col] = digest.pack(shares[col])
+    return packed, stats
@@ -1,39 +1,71 @@
 import json
-import pickle
 import os
 from sentence_transformers import SentenceTransformer
-import numpy as np
+from vector_store import VectorStoreWriter
 
 # ===== CONFIG =====
 DATA_DIR = "/scratch/cjpenni/departmental-honors/rag_pipeline/amazon_products/with_desc"  # folder containing all your .jsonl files
-OUTPUT_FILE = "product_embeddings.pkl"
+STORE_DIR = "product_store"  # vector store read by 2_create_faiss_index.py and 3.2_match_with_rag.py, see vector_store.py
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
 
-# ===== LOAD TITLES AND DESCRIPTIONS FROM ALL FILES =====
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+# Files are streamed in CHUNK_SIZE rows, so peak memory does not depend on file size.
+CHUNK_SIZE = 50_000  # rows read from a .jsonl file at a time
+ENCODE_BATCH_SIZE = 256  # batch size passed to model.encode
+EMBED_DTYPE = "float16"  # "float16" halves the file size, "float32" keeps full precision
 
-with open(OUTPUT_FILE, "wb") as f_out:
-    for filename in os.listdir(DATA_DIR):
-        print(f"Processing file: {filename}")
+
+def iter_products(filepath):
+    """Yield (text, title, description) for every product with a title or description."""
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            data = json.loads(line)
+            title = data.get("title", "")
+            description = data.get("description", "")
+            if title or description:
+                combined = f"title: {title}; description: {description}"
+                yield combined, title, description
+
+
+def iter_chunks(filepath, chunk_size=CHUNK_SIZE):
+    chunk = []
+    for item in iter_products(filepath):
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def embed_streaming(model, data_dir, store_path):
+    # First pass only counts rows so the output matrix can be preallocated
+    counts = {}
+    for filename in sorted(os.listdir(data_dir)):
         if filename.endswith(".jsonl"):
-            filepath = os.path.join(DATA_DIR, filename)
             try:
-                texts = []
-                meta = []
-                with open(filepath, "r", encoding="utf-8") as f:
-                    for line in f:
-                        data = json.loads(line)
-                        title = data.get("title", "")
-                        description = data.get("description", "")
-                        if title or description:
-                            combined = f"title: {title}; description: {description}"
-                            texts.append(combined)
-                            meta.append({"title": title, "description": description})
-                if texts:
-                    embeddings = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-                    # Save this batch as a tuple (meta, embeddings)
-                    pickle.dump((meta, embeddings), f_out)
-                print(f"Processed and saved {len(texts)} items from {filename}")
+                counts[filename] = sum(1 for _ in iter_products(os.path.join(data_dir, filename)))
             except Exception as e:
-                print(f"Error processing {filename}: {e}")
+                print(f"Error reading {filename}, skipping it: {e}")
+    total = sum(counts.values())
+    dim = model.get_sentence_embedding_dimension()
+    print(f"Embedding {total} items from {len(counts)} files into {store_path} ({EMBED_DTYPE}, dim={dim})")
+
+    with VectorStoreWriter(store_path, dim, total, dtype=EMBED_DTYPE,
+                           model_name=MODEL_NAME, normalized=True) as writer:
+        for filename, count in counts.items():
+            print(f"Processing file: {filename}")
+            for chunk in iter_chunks(os.path.join(data_dir, filename)):
+                texts = [text for text, _, _ in chunk]
+                embeddings = model.encode(texts, batch_size=ENCODE_BATCH_SIZE,
+                                          convert_to_numpy=True, normalize_embeddings=True)
+                metas = [{"title": title, "description": description, "source_file": filename}
+                         for _, title, description in chunk]
+                writer.append(embeddings, metas)
+            print(f"Processed and saved {count} items from {filename}")
+
+    print(f"Saved {total} embeddings to {store_path}")
+
 
-print(f"All batches saved to {OUTPUT_FILE}")
+if __name__ == "__main__":
+    model = SentenceTransformer(MODEL_NAME)
+    embed_streaming(model, DATA_DIR, STORE_DIR)
@@ -1,41 +1,50 @@
-import pickle
 import faiss
 import numpy as np
+from vector_store import VectorStore
+from retrieval import make_index
 
-PKL_PATH = "product_embeddings.pkl"
+STORE_DIR = "product_store"
 INDEX_PATH = "product_faiss_index.faiss"
-META_PATH = "product_faiss_metadata.pkl"
-
-def build_faiss_index_stream(pkl_path, index_path, meta_path):
-    index = None
-    all_meta = []
-
-    with open(pkl_path, "rb") as f:
-        while True:
-            try:
-                print("Loading next batch from pickle...")
-                meta, embeddings = pickle.load(f)
-                embeddings = np.array(embeddings, dtype="float32")
-
-                # Initialize index once we know the embedding dimension
-                if index is None:
-                    d = embeddings.shape[1]
-                    index = faiss.IndexFlatL2(d)
-
-                # Add embeddings batch-wise
-                index.add(embeddings)
-                all_meta.extend(meta)
-
-            except EOFError:
-                break
-
-    # Save index and metadata
+ADD_BATCH_SIZE = 100_000  # rows converted to float32 and added to the index at a time
+
+# Index type: "flat" (exact, brute force), "ivf_flat", "ivf_pq" or "hnsw".
+# Use evaluate_index.py to compare recall and latency against "flat".
+INDEX_TYPE = "flat"
+METRIC = "ip"  # "ip" = inner product, i.e. cosine similarity on the normalized embeddings; "l2" for the old behavior
+NLIST = 4096  # IVF: number of coarse clusters
+PQ_M = 16  # IVF-PQ: sub-quantizers per vector (must divide the embedding dim)
+PQ_NBITS = 8  # IVF-PQ: bits per sub-quantizer code
+HNSW_M = 32  # HNSW: neighbors per node
+EF_CONSTRUCTION = 200  # HNSW: build-time search depth
+TRAIN_SAMPLE_SIZE = 256 * NLIST  # rows sampled from the store to train IVF centroids / PQ codebooks
+
+def build_faiss_index_stream(store_dir, index_path, index_type=INDEX_TYPE, metric=METRIC):
+    # FAISS ids are row numbers in the store, so the store doubles as the id -> metadata map
+    with VectorStore(store_dir) as store:
+        # Inner product only equals cosine similarity on unit vectors
+        normalize = metric == "ip" and not store.normalized
+        index = make_index(index_type, store.dim, metric=metric, nlist=NLIST, pq_m=PQ_M, pq_nbits=PQ_NBITS,
+                           hnsw_m=HNSW_M, ef_construction=EF_CONSTRUCTION)
+
+        if not index.is_trained:
+            _, train_vectors = store.sample_vectors(TRAIN_SAMPLE_SIZE)
+            if normalize:
+                faiss.normalize_L2(train_vectors)
+            print(f"Training {index_type} index on {len(train_vectors)} sampled vectors...")
+            index.train(train_vectors)
+
+        # Add embeddings batch-wise straight from the memory-mapped matrix
+        for embeddings in store.iter_vector_batches(ADD_BATCH_SIZE):
+            print(f"Adding rows {index.ntotal}-{index.ntotal + len(embeddings)} of {len(store)}...")
+            embeddings = np.ascontiguousarray(embeddings)
+            if normalize:
+                faiss.normalize_L2(embeddings)
+            index.add(embeddings)
+
+    # Save index
     faiss.write_index(index, index_path)
-    with open(meta_path, "wb") as f:
-        pickle.dump(all_meta, f)
 
-    print(f"Saved FAISS index with {index.ntotal} vectors")
-    print(f"Saved metadata for {len(all_meta)} items")
+    print(f"Saved {index_type} ({metric}) FAISS index with {index.ntotal} vectors")
 
 if __name__ == "__main__":
-    build_faiss_index_stream(PKL_PATH, INDEX_PATH, META_PATH)
+    build_faiss_index_stream(STORE_DIR, INDEX_PATH)
@@ -0,0 +1,72 @@
+import os
+import time
+import faiss
+import numpy as np
+from vector_store import VectorStore
+from retrieval import load_index
+
+# ===== CONFIG =====
+STORE_DIR = "product_store"
+K = 10  # recall@K
+NUM_QUERIES = 1000  # store rows reused as queries
+QUERY_NOISE = 0.05  # perturb queries so they are not exact copies of indexed rows
+GT_BATCH_SIZE = 500_000  # store rows scanned at a time for the exact ground truth
+
+# (index file built by 2_create_faiss_index.py, search parameter, values to sweep)
+CANDIDATES = [
+    ("product_faiss_index.faiss", None, [None]),
+    ("product_faiss_ivf_flat.faiss", "nprobe", [1, 4, 16, 64, 256]),
+    ("product_faiss_ivf_pq.faiss", "nprobe", [1, 4, 16, 64, 256]),
+    ("product_faiss_hnsw.faiss", "ef_search", [16, 32, 64, 128, 256]),
+]
+
+
+def make_queries(store, n, noise, seed=0):
+    _, queries = store.sample_vectors(n, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    queries = queries + noise * rng.standard_normal(queries.shape).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def exact_neighbors(store, queries, k):
+    """Brute-force top-k over the whole store, one block of rows at a time."""
+    heap = faiss.ResultHeap(len(queries), k)
+    start = 0
+    for block in store.iter_vector_batches(GT_BATCH_SIZE):
+        D, I = faiss.knn(queries, np.ascontiguousarray(block), k)
+        heap.add_result(D, np.where(I >= 0, I + start, -1))
+        start += len(block)
+    heap.finalize()
+    return heap.I
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def main():
+    with VectorStore(STORE_DIR) as store:
+        queries = make_queries(store, NUM_QUERIES, QUERY_NOISE)
+        print(f"Computing exact top-{K} for {len(queries)} queries over {len(store)} vectors...")
+        truth = exact_neighbors(store, queries, K)
+
+    print(f"\n{'index':<32} {'param':<16} {'recall@' + str(K):>10} {'ms/query':>10} {'size MB':>10}")
+    for path, param, values in CANDIDATES:
+        if not os.path.exists(path):
+            print(f"{path:<32} (not built, skipping)")
+            continue
+        size_mb = os.path.getsize(path) / 1024 ** 2
+        for value in values:
+            index = load_index(path, **({param: value} if param else {}))
+            start = time.perf_counter()
+            _, found = index.search(queries, K)
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            label = f"{param}={value}" if param else "-"
+            print(f"{path:<32} {label:<16} {recall_at_k(found, truth):>10.3f} {ms:>10.3f} {size_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import faiss
+import numpy as np
+
+# faiss.index_factory strings for the supported index types
+INDEX_TYPES = {
+    "flat": "Flat",
+    "ivf_flat": "IVF{nlist},Flat",
+    "ivf_pq": "IVF{nlist},PQ{pq_m}x{pq_nbits}",
+    "hnsw": "HNSW{hnsw_m}",
+}
+
+
+METRICS = {
+    "ip": faiss.METRIC_INNER_PRODUCT,  # cosine similarity on normalized vectors
+    "l2": faiss.METRIC_L2,
+}
+
+
+def make_index(index_type, dim, metric="ip", nlist=4096, pq_m=16, pq_nbits=8, hnsw_m=32, ef_construction=200):
+    """
+    Create an empty FAISS index of one of INDEX_TYPES.
+    IVF indexes still need `index.train(...)` before vectors can be added.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {list(INDEX_TYPES)}")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {list(METRICS)}")
+    spec = INDEX_TYPES[index_type].format(nlist=nlist, pq_m=pq_m, pq_nbits=pq_nbits, hnsw_m=hnsw_m)
+    index = faiss.index_factory(dim, spec, METRICS[metric])
+    if index_type == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = ef_construction
+    return index
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Apply nprobe (IVF) / efSearch (HNSW); parameters that do not apply are skipped."""
+    params = faiss.ParameterSpace()
+    inner = faiss.downcast_index(index)
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None and hasattr(inner, "hnsw"):
+        params.set_index_parameter(index, "efSearch", ef_search)
+    return index
+
+
+def load_index(path, mmap=True, nprobe=None, ef_search=None):
+    """
+    Read an index written by 2_create_faiss_index.py.
+    With mmap=True the index data stays on disk (IO_FLAG_MMAP) where the index
+    type supports it, otherwise it is read into memory.
+    """
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"Could not mmap {path}, reading it into memory instead: {e}")
+    if index is None:
+        index = faiss.read_index(path)
+    return set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+
+def encode_queries(model, texts, batch_size=256):
+    """Encode query texts the same way the store was built: L2-normalized float32."""
+    vecs = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    vecs = np.array(vecs, dtype="float32", order="C")
+    faiss.normalize_L2(vecs)  # no-op for already normalized vectors, guards models that ignore the flag
+    return vecs
+
+
+def search(index, model, texts, k=1, batch_size=256):
+    """
+    Encode `texts` and search `index` in one batch.
+    Returns (scores, ids) where scores are cosine similarities, higher is closer,
+    for both inner-product and older L2 indexes.
+    """
+    scores, ids = index.search(encode_queries(model, texts, batch_size), k)
+    if index.metric_type == faiss.METRIC_L2:
+        # squared L2 distance between unit vectors -> cosine similarity
+        scores = 1.0 - scores / 2.0
+    return scores, ids
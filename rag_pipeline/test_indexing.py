@@ -1,35 +1,32 @@
-import pickle
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
+from vector_store import VectorStore
+from retrieval import load_index, search
 
 # Paths
-PKL_PATH = "title_embeddings.pkl"
-INDEX_PATH = "faiss_index.faiss"
+STORE_DIR = "product_store"
+INDEX_PATH = "product_faiss_index.faiss"
 
-# Load model (must be the same as used for embeddings.pkl)
+# Load model (must be the same as used to build the vector store)
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 model = SentenceTransformer(MODEL_NAME)
 
-# Load ids and embeddings metadata
-with open(PKL_PATH, "rb") as f:
-    ids, _ = pickle.load(f)
+# Open the vector store, metadata rows are read on demand
+store = VectorStore(STORE_DIR)
 
 # Load FAISS index
-index = faiss.read_index(INDEX_PATH)
+index = load_index(INDEX_PATH)
 print(f"Loaded FAISS index with {index.ntotal} vectors")
 
 def query_index(text, k=3):
-    # Encode query
-    query_vec = model.encode([text]).astype("float32")
-
-    # Search top k
-    D, I = index.search(query_vec, k)
+    # Encode (normalized) and search top k
+    D, I = search(index, model, [text], k)
 
     results = []
-    for rank, (idx, dist) in enumerate(zip(I[0], D[0])):
-        title = ids[idx]  # map back using ids
-        results.append((rank+1, title, dist))
+    for rank, (idx, score) in enumerate(zip(I[0], D[0])):
+        title = store.get_meta(int(idx)).get("title")  # map back using the store row
+        results.append((rank+1, title, score))
 
     return results
 
@@ -38,5 +35,5 @@ if __name__ == "__main__":
     top_results = query_index(query, k=3)
 
     print(f"\n🔎 Query: {query}\nTop 3 results:")
-    for rank, title, dist in top_results:
-        print(f"{rank}. {title} (distance={dist:.4f})")
+    for rank, title, score in top_results:
+        print(f"{rank}. {title} (cosine={score:.4f})")
@@ -0,0 +1,187 @@
+import json
+import os
+import pickle
+import numpy as np
+
+# ===== CONFIG =====
+PKL_PATH = "product_embeddings.pkl"  # old pickle-stream output, only used by convert_pickle_stream
+STORE_DIR = "product_store"
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# Layout of a store directory:
+#   header.json       {"format_version", "dim", "count", "dtype", "model_name", "normalized"}
+#   vectors.npy       (count, dim) matrix, opened with mmap_mode="r"
+#   metadata.jsonl    one JSON object per row, in the same order as vectors.npy
+#   offsets.npy       (count,) uint64 byte offset of each row in metadata.jsonl
+FORMAT_VERSION = 1
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "metadata.jsonl"
+OFFSETS_FILE = "offsets.npy"
+
+
+class VectorStoreWriter:
+    """
+    Writes a store of exactly `count` rows in order, one batch at a time.
+
+    Vectors go straight into a preallocated .npy and each batch only maps its
+    own rows, so memory use depends on the batch size and not the store size.
+    """
+
+    def __init__(self, path, dim, count, dtype="float16", model_name=MODEL_NAME, normalized=True):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.count = count
+        self.dtype = np.dtype(dtype)
+        self.model_name = model_name
+        self.normalized = normalized
+        self.written = 0
+
+        self._vectors_path = os.path.join(path, VECTORS_FILE)
+        vectors = np.lib.format.open_memmap(self._vectors_path, mode="w+", dtype=self.dtype, shape=(count, dim))
+        self._data_offset = vectors.offset
+        del vectors
+        self._row_bytes = self.dtype.itemsize * dim
+        offsets_path = os.path.join(path, OFFSETS_FILE)
+        offsets = np.lib.format.open_memmap(offsets_path, mode="w+", dtype=np.uint64, shape=(count,))
+        offsets_data_start = offsets.offset
+        del offsets
+        self._offsets_file = open(offsets_path, "r+b")
+        self._offsets_file.seek(offsets_data_start)
+        self._meta_file = open(os.path.join(path, METADATA_FILE), "wb")
+
+    def append(self, embeddings, metas):
+        n = len(metas)
+        if embeddings.shape != (n, self.dim):
+            raise ValueError(f"Expected embeddings of shape ({n}, {self.dim}), got {embeddings.shape}")
+        if self.written + n > self.count:
+            raise ValueError(f"Store was sized for {self.count} rows, got {self.written + n}")
+
+        rows = np.memmap(self._vectors_path, dtype=self.dtype, mode="r+",
+                         offset=self._data_offset + self.written * self._row_bytes, shape=(n, self.dim))
+        rows[:] = embeddings
+        rows.flush()
+        del rows
+
+        offsets = np.empty(n, dtype=np.uint64)
+        for i, meta in enumerate(metas):
+            offsets[i] = self._meta_file.tell()
+            self._meta_file.write(json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._offsets_file.write(offsets.astype("<u8").tobytes())
+        self.written += n
+
+    def close(self):
+        self._meta_file.close()
+        self._offsets_file.close()
+        if self.written != self.count:
+            raise ValueError(f"Store was sized for {self.count} rows but only {self.written} were written")
+        header = {
+            "format_version": FORMAT_VERSION,
+            "dim": self.dim,
+            "count": self.count,
+            "dtype": self.dtype.name,
+            "model_name": self.model_name,
+            "normalized": self.normalized,
+        }
+        with open(os.path.join(self.path, HEADER_FILE), "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._meta_file.close()
+            self._offsets_file.close()
+
+
+class VectorStore:
+    """
+    Read-only view of a store directory.
+
+    `vectors` is a zero-copy memory map of the whole matrix, and `get_meta`
+    seeks straight to one row of metadata.jsonl through the offsets index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        if self.header.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported store format version: {self.header.get('format_version')}")
+        self.dim = self.header["dim"]
+        self.count = self.header["count"]
+        self.model_name = self.header["model_name"]
+        self.normalized = self.header["normalized"]
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self._meta_file = open(os.path.join(path, METADATA_FILE), "rb")
+
+    def __len__(self):
+        return self.count
+
+    def get_meta(self, idx):
+        if idx < 0 or idx >= self.count:
+            raise IndexError(f"Row {idx} out of range for store of {self.count} rows")
+        self._meta_file.seek(int(self.offsets[idx]))
+        return json.loads(self._meta_file.readline())
+
+    def get_metas(self, ids):
+        return [self.get_meta(i) for i in ids]
+
+    def iter_vector_batches(self, batch_size=100_000, dtype="float32"):
+        """Yield consecutive row blocks of the matrix converted to `dtype`."""
+        for start in range(0, self.count, batch_size):
+            yield np.asarray(self.vectors[start:start + batch_size], dtype=dtype)
+
+    def sample_vectors(self, n, seed=0, dtype="float32"):
+        """Return (row ids, vectors) for up to n random rows, e.g. to train an index."""
+        rng = np.random.default_rng(seed)
+        ids = np.sort(rng.choice(self.count, size=min(n, self.count), replace=False))
+        return ids, np.asarray(self.vectors[ids], dtype=dtype)
+
+    def iter_metadata(self):
+        self._meta_file.seek(0)
+        for line in self._meta_file:
+            yield json.loads(line)
+
+    def close(self):
+        self._meta_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _iter_pickle_frames(pkl_path):
+    with open(pkl_path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                break
+
+
+def convert_pickle_stream(pkl_path, store_path, model_name=MODEL_NAME, dtype="float16"):
+    """Convert an old product_embeddings.pkl into a store without re-embedding."""
+    count = 0
+    dim = None
+    for meta, embeddings in _iter_pickle_frames(pkl_path):
+        count += len(meta)
+        dim = np.asarray(embeddings).shape[1]
+    if dim is None:
+        raise ValueError(f"No batches found in {pkl_path}")
+
+    with VectorStoreWriter(store_path, dim, count, dtype=dtype, model_name=model_name, normalized=True) as writer:
+        for meta, embeddings in _iter_pickle_frames(pkl_path):
+            writer.append(np.asarray(embeddings), meta)
+    print(f"Converted {count} rows from {pkl_path} to {store_path}")
+
+
+if __name__ == "__main__":
+    convert_pickle_stream(PKL_PATH, STORE_DIR)